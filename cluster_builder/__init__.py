@@ -17,6 +17,17 @@ def default_config(app):
     return {
         'LOG_LEVEL': 'info',
         'LOG_FILE': os.path.join(app.root_path, '..', 'log', 'cluster-builder.log'),
+        'LAUNCH_JOBS_DB': 'launch-jobs.sqlite3',
+        'CLOUD_ASSETS_TIMEOUT': 10,
+        'CLOUD_ASSETS_TTL': 300,
+        'CLOUD_ASSETS_MAX_STALE': 3600,
+        'CLOUD_ASSETS_ERROR_TTL': 30,
+        'CLUSTER_TYPES_WATCH': 'auto',
+        'CLUSTER_TYPES_POLL_INTERVAL': 1.0,
+        'FLAVOR_CACHE_TTL': 300,
+        'SESSION_CACHE_SIZE': 64,
+        'DISCOVERY_CACHE_TTL': 300,
+        'HTTP_POOL_MAXSIZE': 10,
     }
 
 
@@ -86,10 +97,33 @@ def create_app(instance_path=None, test_config=None):
     os.makedirs(os.path.join(app.instance_path, "cluster-types-available"), exist_ok=True)
 
     from .models import ClusterTypeRepo
+    snapshot = app.config.get('CLUSTER_TYPES_SNAPSHOT')
     ClusterTypeRepo.configure(
         types_dir=os.path.join(app.instance_path, "cluster-types-enabled"),
         logger=app.logger,
+        snapshot_path=os.path.join(app.instance_path, snapshot) if snapshot else None,
+        load_workers=app.config.get('CLUSTER_TYPES_LOAD_WORKERS'),
     )
+    watch_mode = app.config.get('CLUSTER_TYPES_WATCH', 'off')
+    if watch_mode and watch_mode != 'off':
+        ClusterTypeRepo.watch(
+            mode=watch_mode,
+            interval=float(app.config.get('CLUSTER_TYPES_POLL_INTERVAL', 1.0)),
+        )
+
+    from .openstack.auth import OpenStackAuth
+    OpenStackAuth.configure(
+        cache_size=int(app.config.get('SESSION_CACHE_SIZE', 64)),
+        discovery_ttl=float(app.config.get('DISCOVERY_CACHE_TTL', 300)),
+        pool_maxsize=int(app.config.get('HTTP_POOL_MAXSIZE', 10)),
+        pool_sizes=app.config.get('HTTP_POOL_SIZES'),
+    )
+
+    from .openstack.flavor_index import FlavorIndexCache
+    FlavorIndexCache.configure(ttl=float(app.config.get('FLAVOR_CACHE_TTL', 300)))
+
+    from .stages import StageGraph
+    StageGraph.configure(max_workers=app.config.get('LAUNCH_STAGE_WORKERS'))
 
     from . import cluster_types
     app.register_blueprint(cluster_types.bp)
@@ -97,8 +131,27 @@ def create_app(instance_path=None, test_config=None):
     from . import clusters
     app.register_blueprint(clusters.bp)
 
+    from .launch_jobs import LaunchJobs
+    jobs_db = app.config.get('LAUNCH_JOBS_DB')
+    config, logger = app.config, app.logger
+    LaunchJobs.configure(
+        path=os.path.join(app.instance_path, jobs_db) if jobs_db else None,
+        logger=logger,
+        runner=lambda data, progress: clusters.run_launch_job(data, progress, config, logger),
+        workers=int(app.config.get('LAUNCH_JOB_WORKERS', 4)),
+        lease=float(app.config.get('LAUNCH_JOB_LEASE', 60)),
+    )
+
     from . import cloud_assets
     app.register_blueprint(cloud_assets.bp)
+    cloud_assets.CloudAssets.configure(
+        timeout=float(app.config.get('CLOUD_ASSETS_TIMEOUT', 10)),
+        workers=app.config.get('CLOUD_ASSETS_WORKERS'),
+        ttl=float(app.config.get('CLOUD_ASSETS_TTL', 300)),
+        ttls=app.config.get('CLOUD_ASSETS_TTLS'),
+        max_stale=float(app.config.get('CLOUD_ASSETS_MAX_STALE', 3600)),
+        error_ttl=float(app.config.get('CLOUD_ASSETS_ERROR_TTL', 30)),
+    )
 
     from .openstack.error_handling import setup_error_handling
     setup_error_handling(app)
@@ -27,9 +27,18 @@
 ==============================================================================
 """
 
-from flask import (Blueprint, current_app, request, make_response)
+import collections
+from concurrent import futures
+import itertools
+import json
+import queue
+import threading
+import time
 
-from .openstack.auth import OpenStackAuth
+from flask import (Blueprint, Response, abort, current_app, request, make_response)
+
+from .openstack.auth import OpenStackAuth, request_timeout
+from .openstack.error_handling import json_api_error
 from .openstack.glance_handler import GlanceHandler
 from .openstack.neutron_handler import NeutronHandler
 from .openstack.nova_handler import NovaHandler
@@ -37,44 +46,406 @@ from .openstack.sahara_handler import SaharaHandler
 
 bp = Blueprint('cloud_assets', __name__, url_prefix="/cloud_assets")
 
+# The number of images fetched from glance per request.
+IMAGE_PAGE_SIZE = 100
+
+
+def pages(items, size):
+    """Return an iterator over lists of up to size of the given items."""
+    items = iter(items)
+    while page := list(itertools.islice(items, size)):
+        yield page
+
+
+def image_pages(glance):
+    images = glance.list_images(page_size=IMAGE_PAGE_SIZE)
+    return pages(({"id": image.name, "name": image.name} for image in images), IMAGE_PAGE_SIZE)
+
+
+# Each kind of asset, the handler used to list it and how to list it.
+#
+# For nova, glance and neutron assets, we intentionally use name as the id.
+# This allows us to have easy defaults specified in the cluster type
+# definitions.
+#
+# For sahara assets, we intentionally use id as the id.  This allows our
+# sahara examples to work but does not support easy specification of
+# defaults.  We could fix that with more effort put into the sahara handler
+# and/or the sahara example cluster types.
+ASSETS = {
+    "flavors": (NovaHandler, lambda nova: [
+        {"id": flavor.name, "name": flavor.name} for flavor in nova.list_flavors(detailed=False)
+    ]),
+    "images": (GlanceHandler, lambda glance: [
+        image for page in image_pages(glance) for image in page
+    ]),
+    "networks": (NeutronHandler, lambda neutron: [
+        {"id": network.name, "name": network.name, "external": network.external} for network in neutron.list_networks()
+    ]),
+    "keypairs": (NovaHandler, lambda nova: [
+        {"id": keypair.name, "name": keypair.name} for keypair in nova.list_keypairs()
+    ]),
+    "sahara.plugins": (SaharaHandler, lambda sahara: [
+        {"id": plugin.id, "name": plugin.name} for plugin in sahara.list_plugins()
+    ]),
+    "sahara.images": (SaharaHandler, lambda sahara: [
+        {"id": image.id, "name": image.name} for image in sahara.list_images()
+    ]),
+    "sahara.cluster_templates": (SaharaHandler, lambda sahara: [
+        {"id": template.id, "name": template.name} for template in sahara.list_cluster_templates()
+    ]),
+}
+
+# Kinds of asset that are listed a page at a time, and how to list their
+# pages.  When streaming, each page is sent as soon as it has been fetched.
+PAGED_ASSETS = {
+    "images": (GlanceHandler, image_pages),
+}
+
+
+# The media type of the streamed listing, with one JSON object per line.
+NDJSON = "application/x-ndjson"
+
+# Query parameters that are not credentials.
+QUERY_PARAMETERS = ("include", "refresh")
+
+
+class CloudAssets:
+    """
+    CloudAssets lists the assets of each kind concurrently, each with a
+    timeout, so that a slow or missing service, e.g., sahara, neither fails
+    the listing nor delays it beyond the timeout.
+
+    The listed assets are cached per set of credentials, as some assets,
+    e.g., keypairs, belong to the user rather than the project.  Assets that
+    are older than their kind's TTL, but not older than `max_stale`, are
+    served from the cache while they are refreshed in the background.
+
+    Kinds that could not be listed are reported as failed, without being
+    listed again, for `error_ttl` seconds, so that a hung service does not
+    tie up more of the pool with each request.
+    """
+    timeout = 10.0
+    ttl = 300.0
+    ttls = {}
+    max_stale = 3600.0
+    error_ttl = 30.0
+    cache_size = 1024
+    _executor = None
+    _cache = collections.OrderedDict()
+    _failures = collections.OrderedDict()
+    _refreshing = set()
+    _lock = threading.Lock()
+
+    @classmethod
+    def configure(cls, timeout, workers=None, ttl=300.0, ttls=None, max_stale=3600.0, error_ttl=30.0):
+        if cls._executor is not None:
+            cls._executor.shutdown(wait=False)
+        cls.timeout = timeout
+        if workers is None:
+            # Enough to list every kind for a few requests at once.
+            workers = 4 * len(ASSETS)
+        cls._executor = futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="cloud-assets")
+        with cls._lock:
+            cls.ttl = ttl
+            cls.ttls = dict(ttls or {})
+            cls.max_stale = max_stale
+            cls.error_ttl = error_ttl
+            cls._cache = collections.OrderedDict()
+            cls._failures = collections.OrderedDict()
+            cls._refreshing = set()
+
+
+    @classmethod
+    def fetch(cls, sess, logger, kinds=ASSETS.keys(), fingerprint=None, refresh=False):
+        """
+        Return a dict of the assets of the given kinds, and a list of errors
+        for any kinds that could not be listed.  The assets of such kinds are
+        given as empty lists.
+
+        If fingerprint, identifying the credentials the session was created
+        from, is given, cached assets are used unless refresh is true.  The
+        session is only authenticated if some kind of asset is listed.
+        """
+        if cls._executor is None:
+            cls.configure(cls.timeout)
+        assets, failed, to_list = cls._cached(kinds, sess, logger, fingerprint, refresh)
+        assets.update(dict.fromkeys(failed, []))
+        errors = list(failed.values())
+        if to_list:
+            # Authenticate up front so that invalid credentials fail the
+            # request rather than each kind of asset.
+            sess.get_token()
+            listed, listing_errors = cls._list_all(to_list, sess, logger, fingerprint)
+            assets.update(listed)
+            errors.extend(listing_errors)
+        return {kind: assets[kind] for kind in kinds}, errors
+
+
+    @classmethod
+    def stream(cls, sess, logger, kinds=ASSETS.keys(), fingerprint=None, refresh=False):
+        """
+        Return an iterator over the assets of the given kinds, as dicts each
+        holding a page of the assets of a single kind, which are yielded as
+        soon as they have been listed.  Kinds that could not be listed are
+        given as a dict holding an error rather than assets.
+
+        The session is authenticated before this returns, if any kind of
+        asset is to be listed.  Kinds in `PAGED_ASSETS` are not cached, so
+        that their assets need not all be held at once.
+        """
+        if cls._executor is None:
+            cls.configure(cls.timeout)
+        cached, failed, to_list = cls._cached(kinds, sess, logger, fingerprint, refresh)
+        if to_list:
+            sess.get_token()
+        return cls._stream(cached, failed, to_list, sess, logger, fingerprint)
+
+
+    @classmethod
+    def _cached(cls, kinds, sess, logger, fingerprint, refresh):
+        """
+        Return a dict of the cached assets of the given kinds, revalidating
+        any that are stale, a dict of the errors of those that recently
+        failed, and a list of the kinds that must be listed.
+        """
+        assets = {}
+        failed = {}
+        to_list = []
+        now = time.monotonic()
+        for kind in kinds:
+            entry = failure = None
+            if fingerprint is not None and not refresh:
+                with cls._lock:
+                    entry = cls._cache.get((fingerprint, kind))
+                    failure = cls._failures.get((fingerprint, kind))
+            if failure is not None and now - failure[0] < cls.error_ttl:
+                failed[kind] = failure[1]
+                continue
+            if entry is None or now - entry[0] >= cls.max_stale:
+                to_list.append(kind)
+                continue
+            assets[kind] = entry[1]
+            if now - entry[0] >= cls.ttls.get(kind, cls.ttl):
+                cls._revalidate(kind, sess, logger, fingerprint)
+        return assets, failed, to_list
+
+
+    @classmethod
+    def _stream(cls, cached, failed, kinds, sess, logger, fingerprint):
+        for kind, assets in cached.items():
+            yield {"kind": kind, "assets": assets}
+        for kind, error in failed.items():
+            yield {"kind": kind, "errors": [error]}
+        if not kinds:
+            return
+
+        # Bounded, so that pages are fetched no faster than they are sent.
+        pages = queue.Queue(maxsize=len(kinds))
+        cancelled = threading.Event()
+
+        def put(kind, page=None, exc=None, done=False):
+            give_up = time.monotonic() + cls.timeout
+            while not cancelled.is_set():
+                try:
+                    pages.put((kind, page, exc, done), timeout=0.1)
+                    return True
+                except queue.Full:
+                    if time.monotonic() >= give_up:
+                        # The client has stopped reading.  Stop the listings
+                        # rather than hold their workers indefinitely.
+                        logger.warning(f"streaming {kind} stalled for {cls.timeout}s; cancelling")
+                        cancelled.set()
+            return False
+
+        def list_kind(kind):
+            try:
+                if kind in PAGED_ASSETS:
+                    handler_class, list_pages = PAGED_ASSETS[kind]
+                    listed = False
+                    with request_timeout(cls.timeout):
+                        for page in list_pages(handler_class(sess, logger)):
+                            listed = True
+                            if not put(kind, page):
+                                return
+                    if not listed:
+                        put(kind, [])
+                    cls._succeeded(fingerprint, kind)
+                else:
+                    put(kind, cls._list(kind, sess, logger, fingerprint))
+            except Exception as exc:
+                put(kind, exc=exc, done=True)
+            else:
+                put(kind, done=True)
+
+        for kind in kinds:
+            cls._executor.submit(list_kind, kind)
+        # Each kind times out if no page of it arrives within the timeout, so
+        # that long paged listings are not cut off part way through.
+        deadlines = dict.fromkeys(kinds, time.monotonic() + cls.timeout)
+        try:
+            while deadlines:
+                try:
+                    kind, page, exc, done = pages.get(timeout=max(0, min(deadlines.values()) - time.monotonic()))
+                except queue.Empty:
+                    now = time.monotonic()
+                    for kind in [kind for kind, deadline in deadlines.items() if deadline <= now]:
+                        del deadlines[kind]
+                        logger.warning(f"listing {kind} timed out after {cls.timeout}s")
+                        yield {"kind": kind, "errors": [cls._failed(fingerprint, kind, cls._timeout_error(kind))]}
+                    continue
+                if kind not in deadlines:
+                    # Already reported as timed out.
+                    continue
+                sent = time.monotonic()
+                if page is not None:
+                    yield {"kind": kind, "assets": page}
+                if exc is not None:
+                    logger.warning(f"listing {kind} failed: {exc}")
+                    yield {"kind": kind, "errors": [cls._failed(fingerprint, kind, json_api_error(exc))]}
+                # A slow client holds up the listings, so the time spent
+                # sending does not count towards any kind's timeout.
+                now = time.monotonic()
+                for other in deadlines:
+                    deadlines[other] += now - sent
+                if done:
+                    del deadlines[kind]
+                else:
+                    deadlines[kind] = now + cls.timeout
+        finally:
+            # Stop the listings if the client has gone away or timed out.
+            cancelled.set()
+
+
+    @classmethod
+    def _list_all(cls, kinds, sess, logger, fingerprint):
+        pending = {kind: cls._executor.submit(cls._list, kind, sess, logger, fingerprint) for kind in kinds}
+        deadline = time.monotonic() + cls.timeout
+        assets = {}
+        errors = []
+        for kind, future in pending.items():
+            try:
+                assets[kind] = future.result(timeout=max(0, deadline - time.monotonic()))
+            except futures.TimeoutError:
+                future.cancel()
+                logger.warning(f"listing {kind} timed out after {cls.timeout}s")
+                assets[kind] = []
+                errors.append(cls._failed(fingerprint, kind, cls._timeout_error(kind)))
+            except Exception as exc:
+                logger.warning(f"listing {kind} failed: {exc}")
+                assets[kind] = []
+                errors.append(cls._failed(fingerprint, kind, json_api_error(exc)))
+        return assets, errors
+
+
+    @staticmethod
+    def _timeout_error(kind):
+        return {"status": "504", "title": "Timeout", "detail": f"Listing {kind} timed out"}
+
+
+    @classmethod
+    def _failed(cls, fingerprint, kind, error):
+        """
+        Return the given error for the kind, recording it so that the kind is
+        not listed again for `error_ttl` seconds.
+        """
+        error = {**error, "source": {"pointer": f"/{kind}"}}
+        if fingerprint is not None and cls.error_ttl > 0:
+            with cls._lock:
+                cls._failures[(fingerprint, kind)] = (time.monotonic(), error)
+                cls._failures.move_to_end((fingerprint, kind))
+                while len(cls._failures) > cls.cache_size:
+                    cls._failures.popitem(last=False)
+        return error
+
+
+    @classmethod
+    def _succeeded(cls, fingerprint, kind):
+        with cls._lock:
+            cls._failures.pop((fingerprint, kind), None)
+
+
+    @classmethod
+    def evict(cls, fingerprint):
+        """
+        Remove the assets, and failures, cached for the given fingerprint.
+        """
+        with cls._lock:
+            for cache in (cls._cache, cls._failures):
+                for key in [key for key in cache if key[0] == fingerprint]:
+                    del cache[key]
+
+
+    @classmethod
+    def _revalidate(cls, kind, sess, logger, fingerprint):
+        with cls._lock:
+            if (fingerprint, kind) in cls._refreshing:
+                return
+            cls._refreshing.add((fingerprint, kind))
+
+        def refresh():
+            try:
+                cls._list(kind, sess, logger, fingerprint)
+            except Exception as exc:
+                logger.warning(f"refreshing {kind} failed: {exc}")
+                if json_api_error(exc)["status"] == "401":
+                    # The credentials are no longer valid, so nothing
+                    # cached for them should be served.
+                    cls.evict(fingerprint)
+            finally:
+                with cls._lock:
+                    cls._refreshing.discard((fingerprint, kind))
+
+        logger.debug(f"refreshing stale {kind} in the background")
+        cls._executor.submit(refresh)
+
+
+    @classmethod
+    def _list(cls, kind, sess, logger, fingerprint=None):
+        handler_class, list_assets = ASSETS[kind]
+        # Bound each request so that a hung service does not hold a worker
+        # for longer than the listing would be waited for.
+        with request_timeout(cls.timeout):
+            assets = list_assets(handler_class(sess, logger))
+        if fingerprint is not None:
+            with cls._lock:
+                cls._failures.pop((fingerprint, kind), None)
+                cls._cache[(fingerprint, kind)] = (time.monotonic(), assets)
+                cls._cache.move_to_end((fingerprint, kind))
+                while len(cls._cache) > cls.cache_size:
+                    cls._cache.popitem(last=False)
+        return assets
+
+
 @bp.get('/')
 def cloud_assets():
-    sess = OpenStackAuth(request.args, current_app.logger).get_session()
-    nova = NovaHandler(sess, current_app.logger)
-    glance = GlanceHandler(sess, current_app.logger)
-    neutron = NeutronHandler(sess, current_app.logger)
-    sahara = SaharaHandler(sess, current_app.logger)
-    cloud_assets = {
-        "flavors": [],
-        "images": [],
-        "networks": [],
-        "keypairs": [],
-        "sahara.plugins": [],
-        "sahara.images": [],
-        "sahara.cluster_templates": [],
-    }
-
-    # For the following, we intentionally use name as the id.  This allows us to
-    # have easy defaults specified in the cluster type definitions.
-    for flavor in nova.list_flavors():
-        cloud_assets["flavors"].append({"id": flavor.name, "name": flavor.name})
-    for keypair in nova.list_keypairs():
-        cloud_assets["keypairs"].append({"id": keypair.name, "name": keypair.name})
-    for image in glance.list_images():
-        cloud_assets["images"].append({"id": image.name, "name": image.name})
-    for network in neutron.list_networks():
-        cloud_assets["networks"].append({"id": network.name, "name": network.name, "external": network.external})
-
-    # For the following, we intentionally use id as the id.  This allows our
-    # sahara examples to work but does not support easy specification of
-    # defaults.  We could fix that with more effort put into the sahara handler
-    # and/or the sahara example cluster types.
-    for plugin in sahara.list_plugins():
-        cloud_assets["sahara.plugins"].append({"id": plugin.id, "name": plugin.name})
-    for image in sahara.list_images():
-        cloud_assets["sahara.images"].append({"id": image.id, "name": image.name})
-    for template in sahara.list_cluster_templates():
-        cloud_assets["sahara.cluster_templates"].append({"id": template.id, "name": template.name})
+    kinds = included_kinds(request.args.getlist("include"))
+    cloud_env = {k: v for k, v in request.args.items() if k not in QUERY_PARAMETERS}
+    auth = OpenStackAuth(cloud_env, current_app.logger)
+    sess = auth.get_session()
+    refresh = request.args.get("refresh", "false").lower() in ("true", "1")
+    if request.accept_mimetypes.best_match(["application/json", NDJSON]) == NDJSON:
+        lines = CloudAssets.stream(sess, current_app.logger, kinds, fingerprint=auth.fingerprint(), refresh=refresh)
+        return Response((json.dumps(line) + "\n" for line in lines), mimetype=NDJSON)
+
+    cloud_assets, errors = CloudAssets.fetch(sess, current_app.logger, kinds, fingerprint=auth.fingerprint(), refresh=refresh)
+    if errors:
+        cloud_assets["errors"] = errors
 
     r = make_response(cloud_assets)
     return r
+
+
+def included_kinds(include):
+    """
+    Return the kinds of asset named by the `include` query parameters, each
+    of which is a comma separated list, or all kinds if there are none.
+    """
+    kinds = [kind.strip() for value in include for kind in value.split(",") if kind.strip()]
+    if not kinds:
+        return list(ASSETS)
+    unknown = [kind for kind in kinds if kind not in ASSETS]
+    if unknown:
+        abort(400, f"Unknown asset kinds: {', '.join(unknown)}")
+    # Keep the order of ASSETS and drop any duplicates.
+    return [kind for kind in ASSETS if kind in kinds]
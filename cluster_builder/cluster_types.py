@@ -27,7 +27,11 @@
 ==============================================================================
 """
 
+import threading
+import weakref
+
 from flask import Blueprint
+from flask import current_app
 from flask import make_response
 from flask import request
 
@@ -36,28 +40,122 @@ from .models import ClusterTypeRepo
 bp = Blueprint('cluster-types', __name__, url_prefix="/cluster-types")
 ATTRIBUTES = ["id", "title", "description", "parameters", "parameter_groups", "last_modified", "order", "logo_url", "instructions"]
 
+
+class RenderedCatalog:
+    """
+    The JSON response bodies for a Catalog.
+
+    A Catalog is never modified, so its response bodies are rendered once and
+    reused until ClusterTypeRepo publishes a new Catalog.  The body for an
+    individual cluster type is rendered when it is first requested, unless
+    the previous RenderedCatalog already has a body for that same cluster
+    type.
+    """
+
+    def __init__(self, catalog, previous=None):
+        self.catalog = catalog
+        self.last_modified = max((ct.last_modified for ct in catalog.cluster_types), default=None)
+        self._bodies = {}
+        self._index_body = None
+        if previous is not None:
+            for id, body in previous._bodies.items():
+                if catalog.by_id.get(id) is previous.catalog.by_id.get(id):
+                    self._bodies[id] = body
+
+    @property
+    def index_body(self):
+        if self._index_body is None:
+            bodies = [self.body(ct) for ct in self.catalog.cluster_types]
+            self._index_body = b"[" + b",".join(body.rstrip(b"\n") for body in bodies) + b"]\n"
+        return self._index_body
+
+    def body(self, cluster_type):
+        if self.catalog.by_id.get(cluster_type.id) is not cluster_type:
+            # Not part of this catalog; the catalog has since changed.
+            return _render(cluster_type)
+        body = self._bodies.get(cluster_type.id)
+        if body is None:
+            body = self._bodies.setdefault(cluster_type.id, _render(cluster_type))
+        return body
+
+
+_rendered = weakref.WeakKeyDictionary()
+_latest = None
+_lock = threading.Lock()
+
+
+def rendered(catalog):
+    """
+    Return the RenderedCatalog for the given catalog.
+    """
+    global _latest
+    with _lock:
+        rendered_catalog = _rendered.get(catalog)
+        if rendered_catalog is None:
+            rendered_catalog = _rendered[catalog] = RenderedCatalog(catalog, previous=_latest)
+            _latest = rendered_catalog
+        return rendered_catalog
+
+
+def _render(cluster_type):
+    return f"{current_app.json.dumps(cluster_type.asdict(ATTRIBUTES))}\n".encode()
+
+
+def _json_response(body):
+    r = make_response(body)
+    r.mimetype = "application/json"
+    return r
+
+
+def _not_modified(etag, last_modified):
+    """
+    Return a 304 response if the client's copy, as identified by the
+    conditional request headers, is current.  Otherwise return None.
+    """
+    if request.if_none_match:
+        # If-Modified-Since is ignored when If-None-Match is given.
+        current = etag is not None and request.if_none_match.contains_weak(etag)
+    else:
+        current = (request.if_modified_since and last_modified != None and
+                   int(request.if_modified_since.timestamp()) == int(last_modified.timestamp()))
+    if not current:
+        return None
+    r = make_response('', 304)
+    if etag is not None:
+        r.set_etag(etag)
+    r.last_modified = last_modified
+    return r
+
+
 @bp.route('/')
 def index():
-    cluster_types = []
-    last_modified = None
-    for ct in ClusterTypeRepo.all():
-        if last_modified == None or ct.last_modified > last_modified: last_modified = ct.last_modified
-        cluster_types.append(ct.asdict(ATTRIBUTES))
-    if (request.if_modified_since and last_modified != None and
-       int(request.if_modified_since.timestamp()) == int(last_modified.timestamp())):
-        return '', 304
-
-    r = make_response(cluster_types)
+    catalog = ClusterTypeRepo.latest()
+    rendered_catalog = rendered(catalog)
+    last_modified = rendered_catalog.last_modified
+    not_modified = _not_modified(catalog.etag, last_modified)
+    if not_modified is not None:
+        return not_modified
+
+    r = _json_response(rendered_catalog.index_body)
+    r.set_etag(catalog.etag)
     r.last_modified = last_modified
     return r
 
 @bp.route('/<string:id>')
 def show_cluster_type(id):
     type = ClusterTypeRepo.find(id)
+    catalog = ClusterTypeRepo.catalog()
+    etag = catalog.etags.get(id)
+    if catalog.by_id.get(id) is not type:
+        # The catalog has changed since the cluster type was found.
+        etag = None
     last_modified = type.last_modified
-    if (request.if_modified_since and int(request.if_modified_since.timestamp()) == int(last_modified.timestamp())):
-        return '', 304
+    not_modified = _not_modified(etag, last_modified)
+    if not_modified is not None:
+        return not_modified
 
-    r = make_response(type.asdict(ATTRIBUTES))
+    r = _json_response(rendered(catalog).body(type))
+    if etag is not None:
+        r.set_etag(etag)
     r.last_modified = type.last_modified
     return r
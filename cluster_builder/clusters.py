@@ -27,16 +27,19 @@
 ==============================================================================
 """
 
-from flask import (Blueprint, current_app, g, request, make_response)
+from flask import (Blueprint, abort, current_app, g, request, make_response, url_for)
 from flask_expects_json import expects_json
 
 from .models import (ClusterTypeRepo, utils as model_utils)
 from .openstack.auth import OpenStackAuth
+from .openstack.flavor_index import FlavorIndexCache
 from .openstack.heat_handler import HeatHandler
 from .openstack.magnum_handler import MagnumHandler
 from .openstack.sahara_handler import SaharaHandler
 from .openstack.nova_handler import NovaHandler
 from .openstack.cinder_handler import CinderHandler
+from .stages import StageGraph
+from .launch_jobs import LaunchJobs
 from .middleware.middleware import MiddlewareService
 from .middleware.utils.auth import assert_authenticated
 
@@ -57,7 +60,8 @@ create_schema = {
                     "password": { "type": "string" },
                     "project_id": { "type": "string" },
                     },
-                "required": ["auth_url", "user_id", "password", "project_id"]
+                "required": ["auth_url", "user_id", "password", "project_id"],
+                "not": {"required": ["token"]}
                 },
 
             "project_id": {
@@ -71,7 +75,35 @@ create_schema = {
                     "project_id": { "type": "string" },
                     "user_domain_name": { "type": "string" }
                     },
-                "required": ["auth_url", "username", "password", "project_id", "user_domain_name"]
+                "required": ["auth_url", "username", "password", "project_id", "user_domain_name"],
+                "not": {"required": ["token"]}
+                },
+
+            "token_and_project_id": {
+                "$id": "/schemas/token_and_project_id",
+
+                "type": "object",
+                "properties": {
+                    "auth_url": { "type": "string", "format": "uri" },
+                    "token": { "type": "string" },
+                    "project_id": { "type": "string" },
+                    },
+                "required": ["auth_url", "token", "project_id"],
+                "not": {"required": ["password"]}
+                },
+
+            "token_and_project_name": {
+                "$id": "/schemas/token_and_project_name",
+
+                "type": "object",
+                "properties": {
+                    "auth_url": { "type": "string", "format": "uri" },
+                    "token": { "type": "string" },
+                    "project_name": { "type": "string" },
+                    "project_domain_name": { "type": "string" }
+                    },
+                "required": ["auth_url", "token", "project_name", "project_domain_name"],
+                "not": {"required": ["password"]}
                 },
 
             "project_name": {
@@ -86,7 +118,8 @@ create_schema = {
                     "project_domain_name": { "type": "string" },
                     "user_domain_name": { "type": "string" }
                     },
-                "required": ["auth_url", "username", "password", "project_name", "project_domain_name", "user_domain_name"]
+                "required": ["auth_url", "username", "password", "project_name", "project_domain_name", "user_domain_name"],
+                "not": {"required": ["token"]}
                 }
             },
 
@@ -94,7 +127,13 @@ create_schema = {
         "properties": {
             "cloud_env": {
                 "type": "object",
-                "oneOf": [{"$ref": "/schemas/user_id_and_project_id"}, {"$ref": "/schemas/project_id"}, {"$ref": "/schemas/project_name"}]
+                "oneOf": [
+                    {"$ref": "/schemas/user_id_and_project_id"},
+                    {"$ref": "/schemas/project_id"},
+                    {"$ref": "/schemas/project_name"},
+                    {"$ref": "/schemas/token_and_project_id"},
+                    {"$ref": "/schemas/token_and_project_name"}
+                    ]
                 },
             "cluster": {
                 "type": "object",
@@ -133,55 +172,99 @@ def create_cluster():
         raise TypeError(f"Unknown cluster type kind '{cluster_type.kind}' for cluster type '{cluster_type.id}'")
     
 
-    # Creating Middleware Service Object
-    middlewareservice  = MiddlewareService(current_app.config, current_app.logger, g.data['middleware_url'])
+    if LaunchJobs.enabled() and "respond-async" in request.headers.get("Prefer", ""):
+        job_id = LaunchJobs.submit(g.data)
+        response = make_response(LaunchJobs.get(job_id), 202)
+        response.headers["Location"] = url_for("clusters.show_job", id=job_id)
+        response.headers["Preference-Applied"] = "respond-async"
+        return response
 
+    cluster = launch_cluster(g.data, cluster_type, handler_class, current_app.config, current_app.logger)
+    body = {"id": cluster.id, "name": cluster.name}
+    return make_response(body, 201)
 
-    # Obtaining Billing account credits
-    billing_account_credits = middlewareservice.get_credits({'billing_account_id' : g.data['billing_account_id']})
-    current_app.logger.info(f"Billing account credits available : {billing_account_credits}")
 
-    # Checking for enough credits
-    if not int(billing_account_credits) > 0:
-       raise MiddlewareInsufficientCredits("Insufficient credits to launch a cluster")
+@bp.get('/jobs/<id>')
+def show_job(id):
+    assert_authenticated(current_app.config, request.headers, current_app.logger)
+    job = LaunchJobs.get(id) if LaunchJobs.enabled() else None
+    if job is None:
+        abort(404)
+    return make_response(job, 200)
+
+
+def run_launch_job(data, progress, config, logger):
+    """
+    Launch the cluster for an asynchronous launch job.  The request has
+    already been validated, but the cluster type is looked up again as the
+    job may have been resumed after a restart.
+    """
+    cluster_type = ClusterTypeRepo.find(data["cluster"]["cluster_type_id"])
+    handler_class = handlers.get(cluster_type.kind)
+    if handler_class is None:
+        raise TypeError(f"Unknown cluster type kind '{cluster_type.kind}' for cluster type '{cluster_type.id}'")
+    return launch_cluster(data, cluster_type, handler_class, config, logger, progress)
+
+
+def launch_cluster(data, cluster_type, handler_class, config, logger, progress=lambda stage: None):
+    """
+    Launch a cluster of the given cluster type as described by data, the
+    validated body of a create request, and return the created cluster.
+    `progress` is called with the name of each stage of the launch as it
+    starts.
+
+    The launch does not use the Flask request or application context, so can
+    be run outside of a request.
+    """
+    middlewareservice = MiddlewareService(config, logger, data['middleware_url'])
+
+    def check_credits():
+        billing_account_credits = middlewareservice.get_credits({'billing_account_id' : data['billing_account_id']})
+        logger.info(f"Billing account credits available : {billing_account_credits}")
+        if not int(billing_account_credits) > 0:
+            raise MiddlewareInsufficientCredits("Insufficient credits to launch a cluster")
+
+    def authenticate():
+        sess = OpenStackAuth(data["cloud_env"], logger).get_session()
+        sess.get_token()
+        return sess
+
+    # Pre-flight checks.  These are independent of each other, bar needing
+    # an openstack session, so they are run concurrently.
+    preflight = StageGraph(logger)
+    preflight.add("credits", check_credits)
+    preflight.add("session", authenticate)
+    preflight.add("handler", lambda sess: handler_class(sess, logger), "session")
+    preflight.add("flavors", lambda sess: FlavorIndexCache.get(sess, logger), "session")
+    preflight.add("nova_limits", lambda sess: NovaHandler(sess, logger).get_limits(), "session")
+    preflight.add("cinder_limits", lambda sess: CinderHandler(sess, logger).get_limits(), "session")
+    results = preflight.run()
+
+    handler = results["handler"]
+    flavors = results["flavors"]
+    project_limits = {**results["nova_limits"], **results["cinder_limits"]}
+    logger.info(f"Project limits : {project_limits}")
 
     # Creating Billing Order/Subscription
-    order_id = middlewareservice.create_order({'billing_account_id' : g.data['billing_account_id']})
-
-    # Creating Openstack Cluster
-    sess = OpenStackAuth(g.data["cloud_env"], current_app.logger).get_session()
-    handler = handler_class(sess, current_app.logger)
-
-    # Get flavours and limits for usage checks
-    nova = NovaHandler(sess, current_app.logger)
-    flavors = nova.list_flavors()
-    project_limits = get_project_limits(sess, current_app.logger)
-    current_app.logger.info(f"Project limits : {project_limits}")
+    progress("ordering")
+    order_id = middlewareservice.create_order({'billing_account_id' : data['billing_account_id']})
 
+    progress("creating")
     try:
-        cluster = handler.create_cluster(g.data["cluster"], cluster_type, project_limits, flavors)
+        cluster = handler.create_cluster(data["cluster"], cluster_type, project_limits, flavors)
     except Exception as e:
         # Deleting Billing order if cluster creation fails
-        current_app.logger.error(f"Cluster creation failed : {e}")
+        logger.error(f"Cluster creation failed : {e}")
         middlewareservice.delete_order({'order_id' : order_id})
         # Re-raise error so that it is processed by the error handling defined
         # in the .openstack.error_handling module.
         raise e
 
-    current_app.logger.debug(f"created cluster {cluster.id}:{cluster.name}")
+    logger.debug(f"created cluster {cluster.id}:{cluster.name}")
 
     # Associating Openstack stack ID with Billing order/subscription
+    progress("tagging")
     middlewareservice.add_order_tag({'order_id' : order_id, 'tag_name' : 'openstack_stack_id', 'tag_value' : cluster.id})
     middlewareservice.add_order_tag({'order_id' : order_id, 'tag_name' : 'openstack_stack_name', 'tag_value' : cluster.name})
 
-    body = {"id": cluster.id, "name": cluster.name}
-    return make_response(body, 201)
-
-# Project id is determined by session (i.e. whichever project id is used for auth)
-def get_project_limits(session, logger):
-    nova = NovaHandler(session, logger)
-    cinder = CinderHandler(session, logger)
-    limits = nova.get_limits()
-    volume_limits = cinder.get_limits()
-    limits.update(volume_limits)
-    return limits
+    return cluster
@@ -0,0 +1,334 @@
+"""
+==============================================================================
+ Copyright (C) 2024-present Alces Flight Ltd.
+
+ This file is part of Concertim Cluster Builder.
+
+ This program and the accompanying materials are made available under
+ the terms of the Eclipse Public License 2.0 which is available at
+ <https://www.eclipse.org/legal/epl-2.0>, or alternative license
+ terms made available by Alces Flight Ltd - please direct inquiries
+ about licensing to licensing@alces-flight.com.
+
+ Concertim Visualisation App is distributed in the hope that it will be useful, but
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, EITHER EXPRESS OR
+ IMPLIED INCLUDING, WITHOUT LIMITATION, ANY WARRANTIES OR CONDITIONS
+ OF TITLE, NON-INFRINGEMENT, MERCHANTABILITY OR FITNESS FOR A
+ PARTICULAR PURPOSE. See the Eclipse Public License 2.0 for more
+ details.
+
+ You should have received a copy of the Eclipse Public License 2.0
+ along with Concertim Visualisation App. If not, see:
+
+  https://opensource.org/licenses/EPL-2.0
+
+ For more information on Concertim Cluster Builder, please visit:
+ https://github.com/openflighthpc/concertim-cluster-builder
+==============================================================================
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import datetime
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+
+from .openstack.error_handling import json_api_error
+
+# Stages of a launch after which it is not safe to run the launch again, as
+# it may have created a billing order or a cluster.
+UNSAFE_TO_REPEAT = ("ordering", "creating", "tagging")
+
+
+class LeaseLostError(Exception):
+    """
+    Raised to stop a launch when its store no longer holds the job's lease,
+    as another store may be running it.
+    """
+
+
+class LaunchJobStore:
+    """
+    LaunchJobStore persists asynchronous cluster launch jobs to an SQLite
+    database.
+
+    A job's payload is the validated create request, including the cloud
+    credentials.  The database is only readable by the owner and the payload
+    is removed as soon as the job has finished.
+
+    The database may be shared by several processes, e.g., gunicorn workers.
+    Each store has a unique owner id, and a job is run by the store that
+    holds its lease.  The lease must be renewed within `lease` seconds, else
+    the job may be claimed by another store.  Updates to a job are only made
+    by the store that holds its lease.
+    """
+    def __init__(self, path, lease=60.0):
+        self.path = path
+        self.lease = lease
+        self.owner = secrets.token_hex(8)
+        self._lock = threading.Lock()
+        # Create the file with restrictive permissions before SQLite does.
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        os.close(fd)
+        os.chmod(path, 0o600)
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.row_factory = sqlite3.Row
+        with self._lock:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("""
+                CREATE TABLE IF NOT EXISTS launch_jobs (
+                    id TEXT PRIMARY KEY,
+                    cluster_type_id TEXT NOT NULL,
+                    state TEXT NOT NULL,
+                    stage TEXT,
+                    payload TEXT,
+                    cluster TEXT,
+                    errors TEXT,
+                    created_at TEXT NOT NULL,
+                    updated_at TEXT NOT NULL,
+                    owner TEXT,
+                    lease_expires REAL
+                )""")
+            columns = {row["name"] for row in self._connection.execute("PRAGMA table_info(launch_jobs)")}
+            for column, type in (("owner", "TEXT"), ("lease_expires", "REAL")):
+                if column not in columns:
+                    self._connection.execute(f"ALTER TABLE launch_jobs ADD COLUMN {column} {type}")
+        # SQLite creates the WAL files with the database's permissions, but
+        # make sure of it.
+        for suffix in ("-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.chmod(path + suffix, 0o600)
+
+
+    def create(self, payload):
+        id = secrets.token_urlsafe(16)
+        now = _now()
+        with self._lock:
+            self._connection.execute(
+                "INSERT INTO launch_jobs (id, cluster_type_id, state, payload, created_at, updated_at, owner, lease_expires)"
+                " VALUES (?, ?, 'queued', ?, ?, ?, ?, ?)",
+                (id, payload["cluster"]["cluster_type_id"], json.dumps(payload), now, now,
+                 self.owner, time.time() + self.lease),
+            )
+        return id
+
+
+    def claim(self, id):
+        """
+        Take the lease of the unfinished job, if it is not held by another
+        store.  Return True if this store now holds the lease.
+        """
+        now = time.time()
+        with self._lock:
+            cursor = self._connection.execute(
+                "UPDATE launch_jobs SET owner = ?, lease_expires = ?"
+                " WHERE id = ? AND state IN ('queued', 'running')"
+                " AND (owner IS NULL OR owner = ? OR lease_expires < ?)",
+                (self.owner, now + self.lease, id, self.owner, now),
+            )
+        return cursor.rowcount == 1
+
+
+    def renew(self):
+        """Renew the leases of the unfinished jobs held by this store."""
+        with self._lock:
+            self._connection.execute(
+                "UPDATE launch_jobs SET lease_expires = ? WHERE owner = ? AND state IN ('queued', 'running')",
+                (time.time() + self.lease, self.owner),
+            )
+
+
+    def get(self, id):
+        """Return the job, without its payload, or None if there is no such job."""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT id, cluster_type_id, state, stage, cluster, errors, created_at, updated_at"
+                " FROM launch_jobs WHERE id = ?", (id,)
+            ).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["cluster"] = json.loads(job["cluster"]) if job["cluster"] else None
+        job["errors"] = json.loads(job["errors"]) if job["errors"] else None
+        return job
+
+
+    def payload(self, id):
+        with self._lock:
+            row = self._connection.execute("SELECT payload FROM launch_jobs WHERE id = ?", (id,)).fetchone()
+        return None if row is None or row["payload"] is None else json.loads(row["payload"])
+
+
+    def update(self, id, state, stage=None):
+        """
+        Update the job, renewing its lease.  Return False, without updating
+        it, if this store no longer holds an unexpired lease of the job.
+        """
+        now = time.time()
+        with self._lock:
+            cursor = self._connection.execute(
+                "UPDATE launch_jobs SET state = ?, stage = ?, updated_at = ?, lease_expires = ?"
+                " WHERE id = ? AND owner = ? AND lease_expires >= ?",
+                (state, stage, _now(), now + self.lease, id, self.owner, now),
+            )
+        return cursor.rowcount == 1
+
+
+    def finish(self, id, cluster=None, errors=None):
+        """Record the outcome of the job and remove its payload."""
+        state = "failed" if errors else "succeeded"
+        with self._lock:
+            self._connection.execute(
+                "UPDATE launch_jobs SET state = ?, payload = NULL, cluster = ?, errors = ?, updated_at = ?,"
+                " lease_expires = NULL WHERE id = ? AND owner = ? AND lease_expires >= ?",
+                (state, cluster and json.dumps(cluster), errors and json.dumps(errors), _now(), id, self.owner,
+                 time.time()),
+            )
+
+
+    def unfinished(self):
+        """
+        Return the id and stage of the jobs that have not finished and whose
+        lease has expired, i.e., whose store is no longer running them.
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT id, stage FROM launch_jobs WHERE state IN ('queued', 'running')"
+                " AND (owner IS NULL OR lease_expires < ?) ORDER BY created_at, rowid",
+                (time.time(),),
+            ).fetchall()
+        return [(row["id"], row["stage"]) for row in rows]
+
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+class LaunchJobs:
+    """
+    LaunchJobs runs asynchronous cluster launches on a pool of worker threads,
+    recording their progress in a LaunchJobStore.
+
+    A heartbeat thread renews the leases of this process's jobs and recovers
+    jobs whose lease has expired, e.g., because the process running them
+    has died.
+    """
+    store = None
+    _executor = None
+    _heartbeat = None
+    _stop = None
+
+    @classmethod
+    def configure(cls, path, logger, runner, workers=4, lease=60.0):
+        """
+        Configure the job store at path and resume any jobs left unfinished
+        by a previous run.  `runner` is called with a job's payload and a
+        callback to report the launch's progress, and returns the created
+        cluster.  If path is None, asynchronous launches are disabled.
+        """
+        if cls._heartbeat is not None:
+            cls._stop.set()
+            cls._heartbeat.join()
+            cls._heartbeat = None
+        if cls._executor is not None:
+            cls._executor.shutdown(wait=False)
+            cls._executor = None
+        if cls.store is not None:
+            cls.store.close()
+            cls.store = None
+        if path is None:
+            return
+        cls.logger = logger
+        cls.runner = runner
+        cls.store = LaunchJobStore(path, lease=lease)
+        cls._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="launch-job")
+        cls._recover()
+        cls._stop = threading.Event()
+        cls._heartbeat = threading.Thread(
+            target=cls._beat, args=(cls.store, cls._stop), name="launch-job-heartbeat", daemon=True,
+        )
+        cls._heartbeat.start()
+
+
+    @classmethod
+    def enabled(cls):
+        return cls.store is not None
+
+
+    @classmethod
+    def submit(cls, payload):
+        id = cls.store.create(payload)
+        cls.logger.info(f"queued launch job {id} for {payload['cluster']['cluster_type_id']}")
+        cls._executor.submit(cls._run, cls.store, id)
+        return id
+
+
+    @classmethod
+    def get(cls, id):
+        return cls.store.get(id)
+
+
+    @classmethod
+    def _beat(cls, store, stop):
+        while not stop.wait(store.lease / 3):
+            try:
+                store.renew()
+                cls._recover()
+            except Exception as exc:
+                cls.logger.exception(f"launch job heartbeat failed: {exc}")
+
+
+    @classmethod
+    def _recover(cls):
+        for id, stage in cls.store.unfinished():
+            if not cls.store.claim(id):
+                # Claimed by another process first.
+                continue
+            if stage in UNSAFE_TO_REPEAT:
+                # The job may have created an order or a cluster; running it
+                # again could launch a duplicate.
+                cls.logger.warning(f"launch job {id} was interrupted during {stage}")
+                cls.store.finish(id, errors=[{
+                    "status": "500",
+                    "title": "Interrupted",
+                    "detail": f"The launch was interrupted during {stage}; the cluster may need to be checked manually",
+                }])
+            else:
+                cls.logger.info(f"resuming launch job {id}")
+                cls._executor.submit(cls._run, cls.store, id)
+
+
+    @classmethod
+    def _run(cls, store, id):
+        payload = store.payload(id)
+        if payload is None:
+            return
+        if not store.update(id, "running", "preflight"):
+            return
+
+        def progress(stage):
+            # Each stage is recorded before it starts, so the launch stops
+            # before an unsafe stage if another store may be running it.
+            if not store.update(id, "running", stage):
+                raise LeaseLostError(f"lost the lease of launch job {id} before {stage}")
+
+        try:
+            cluster = cls.runner(payload, progress)
+        except LeaseLostError as exc:
+            # The job is left for the store that now holds, or next claims,
+            # its lease.
+            cls.logger.warning(str(exc))
+        except Exception as exc:
+            cls.logger.exception(f"launch job {id} failed: {exc}")
+            store.finish(id, errors=[json_api_error(exc)])
+        else:
+            cls.logger.info(f"launch job {id} created cluster {cluster.id}:{cluster.name}")
+            store.finish(id, cluster={"id": cluster.id, "name": cluster.name})
+
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds")
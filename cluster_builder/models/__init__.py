@@ -1,3 +1,4 @@
 from .cluster_type import *
 from .cluster_type_factory import *
 from .cluster_type_repo import *
+from .quota_model import *
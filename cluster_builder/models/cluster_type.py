@@ -27,8 +27,13 @@
 ==============================================================================
 """
 
-from dataclasses import asdict, dataclass, field
+from dataclasses import dataclass, field, fields, is_dataclass
 import datetime
+from functools import cached_property
+
+import yaml
+
+from .quota_model import QuotaModel
 
 
 @dataclass(kw_only=True)
@@ -65,15 +70,38 @@ class BaseClusterType:
 
 
     def asdict(self, attributes=None):
-        if attributes is None:
-            return self._serializable_attributes()
-        else:
-            return {k: v for k, v in self._serializable_attributes().items() if k in attributes}
+        """
+        Return a dict of the given serializable attributes, or of all of them
+        if attributes is None.
+
+        Only the requested attributes are visited and their values are not
+        copied; the returned dict shares data with the cluster type and must
+        not be modified.
+        """
+        names = self._serializable_attributes()
+        if attributes is not None:
+            names = [name for name in names if name in attributes]
+        return {name: _serialize(getattr(self, name)) for name in names}
 
 
     def _serializable_attributes(self):
-        """Return a dict of serializable attributes"""
-        return asdict(self)
+        """Return the names of the serializable attributes"""
+        return [f.name for f in fields(self)]
+
+
+def _serialize(value):
+    """
+    Return value with any dataclasses converted to dicts.
+
+    Dicts are returned as is.  They hold data parsed from the cluster type
+    definitions and HOT templates and never contain dataclasses.
+    """
+    if is_dataclass(value):
+        return {f.name: _serialize(getattr(value, f.name)) for f in fields(value)}
+    elif isinstance(value, (list, tuple)):
+        return [_serialize(v) for v in value]
+    else:
+        return value
 
 
 @dataclass(kw_only=True)
@@ -107,6 +135,9 @@ class Component:
     resources: dict = field(default_factory=dict)
     conditions: dict = field(default_factory=dict)
     outputs: dict = field(default_factory=dict)
+    # The contents of the files referenced by the component keyed by their
+    # absolute URL, as sent to heat along with the template.
+    files: dict = field(default_factory=dict)
     last_modified: datetime.datetime
     is_optional: bool
     name: str
@@ -120,34 +151,167 @@ class HeatClusterType(BaseClusterType):
     components: list[Component]
 
 
-    @property
+    # Cluster types are not modified once loaded; a changed definition or
+    # component results in a new instance.  The merged parameters are
+    # therefore computed once per instance and must be treated as read-only.
+
+    @cached_property
     def parameters(self):
         # Load parameters from all components giving precendence to parameters
         # defined in earlier components where there is an id clash.
-        parameters = {}
-        for component in self.components:
-            for id, parameter in component.parameters.items():
-                if id not in parameters:
-                    parameters[id] = parameter
+        parameters = self._merge_parameters(self.components)
 
         if self.hardcoded_parameters is None:
             return parameters
         else:
-            params = {}
+            # Hardcoded params are not displayed to the user.  The hardcoded
+            # value will be provided to OpenStack exactly as provided in the
+            # cluster definition.
             hardcoded_names = self.hardcoded_parameters.keys()
-            for key, value in parameters.items():
-                if key in hardcoded_names:
-                    # Hardcoded params are not displayed to the user.  The
-                    # hardcoded value will be provided to OpenStack exactly as
-                    # provided in the cluster definition.
-                    pass
-                else:
-                    params[key] = value
-            return params
+            return {k: v for k, v in parameters.items() if k not in hardcoded_names}
+
+
+    def components_for(self, selections):
+        """
+        Return the components included by the given optional component
+        selections, that is all mandatory components and those optional
+        components that have been selected.
+        """
+        return self._selected(selections)[1]
+
+
+    def parameters_for(self, selections):
+        """
+        Return the parameters defined by the components included by the given
+        optional component selections, including any hardcoded parameters.
+        """
+        return self._for_selection("parameters", selections, self._merge_parameters)
+
+
+    def template_for(self, selections):
+        """
+        Return the HOT template merged from the components included by the
+        given optional component selections.
+
+        Raises RuntimeError if the included components cannot be merged.
+        """
+        return self._for_selection("template", selections, self._merge_template)
+
+
+    def template_yaml_for(self, selections):
+        """
+        Return the merged HOT template for the given optional component
+        selections serialized as YAML.
+        """
+        template = self.template_for(selections)
+        return self._for_selection("template_yaml", selections,
+                                   lambda _: yaml.safe_dump(template, sort_keys=False))
+
+
+    def files_for(self, selections):
+        """
+        Return the contents of the files referenced by the merged HOT template
+        for the given optional component selections.
+        """
+        return self._for_selection("files", selections, self._merge_files)
+
+
+    def quota_model_for(self, selections):
+        """
+        Return the compiled quota cost of the merged HOT template for the
+        given optional component selections.
+        """
+        template = self.template_for(selections)
+        files = self.files_for(selections)
+        return self._for_selection("quota_model", selections,
+                                   lambda _: QuotaModel.compile(template["resources"], files))
+
+
+    def _selected(self, selections):
+        selections = selections or {}
+        components = [
+            c for c in self.components
+            if not c.is_optional or selections.get(c.name, False)
+        ]
+        key = frozenset(c.name for c in components if c.is_optional)
+        return key, components
+
+
+    def _for_selection(self, name, selections, build):
+        """
+        Return the value of `name` for the given selections, building it from
+        the selected components if it has not already been built.
+
+        There are few distinct selections for a cluster type, so the values
+        are kept for the lifetime of the cluster type.
+        """
+        key, components = self._selected(selections)
+        try:
+            return self._selection_cache[(name, key)]
+        except KeyError:
+            return self._selection_cache.setdefault((name, key), build(components))
+
+
+    @cached_property
+    def _selection_cache(self):
+        return {}
+
+
+    @staticmethod
+    def _merge_parameters(components):
+        parameters = {}
+        for component in components:
+            for id, parameter in component.parameters.items():
+                if id not in parameters:
+                    parameters[id] = parameter
+        return parameters
+
+
+    @staticmethod
+    def _merge_files(components):
+        files = {}
+        for component in components:
+            files.update(component.files)
+        return files
+
+
+    @classmethod
+    def _merge_template(cls, components):
+        merged_resources = {}
+        merged_outputs = {}
+        merged_conditions = {}
+        heat_template_versions = []
+
+        for component in components:
+            heat_template_versions.append(component.heat_template_version)
+
+            for resource in component.resources:
+                if resource in merged_resources:
+                    raise RuntimeError(f"no good! duplicate resource identifiers {resource}")
+            merged_resources.update(component.resources)
+
+            for output in component.outputs:
+                if output in merged_outputs:
+                    raise RuntimeError(f"no good! duplicate output identifiers {output}")
+            merged_outputs.update(component.outputs)
+
+            for condition in component.conditions:
+                if condition in merged_conditions:
+                    raise RuntimeError(f"no good! duplicate condition identifiers {condition}")
+            merged_conditions.update(component.conditions)
+
+        if len(list(set(heat_template_versions))) > 1:
+            raise RuntimeError(f"no good! incompatible heat template versions {heat_template_versions}")
+
+        return {
+            "heat_template_version": heat_template_versions[0],
+            "parameters": cls._merge_parameters(components),
+            "resources": merged_resources,
+            "conditions": merged_conditions,
+            "outputs": merged_outputs,
+        }
 
 
     def _serializable_attributes(self):
-        """Return a dict of serializable attributes"""
-        attrs = {"parameters": self.parameters}
-        attrs.update(asdict(self))
-        return attrs
+        """Return the names of the serializable attributes"""
+        return ["parameters", *super()._serializable_attributes()]
@@ -27,14 +27,24 @@
 ==============================================================================
 """
 
+import base64
+import collections
+import copy
 import datetime
+import hashlib
 import os
-import urllib
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
 
+from heatclient.common import template_format
 from heatclient.common import template_utils
+from heatclient.common import utils as heatclientUtils
 from heatclient import exc as heatclientExceptions
 from jsonschema.exceptions import (best_match)
 import jsonschema
+from oslo_serialization import jsonutils
 
 from .cluster_type import (BaseClusterType, SaharaClusterType, MagnumClusterType, HeatClusterType, Component, Instruction)
 
@@ -123,6 +133,30 @@ SCHEMA_DEFS = {
 }
 
 
+class CompiledSchema:
+    """
+    A JSON schema compiled once into a reusable validator.
+
+    `jsonschema.validate` checks the schema against its meta-schema and builds
+    a new validator and `$ref` resolver on every call.  Validating against a
+    CompiledSchema avoids that work whilst raising the same error.
+    """
+
+    def __init__(self, schema):
+        validator_class = jsonschema.validators.validator_for(schema)
+        validator_class.check_schema(schema)
+        self._validator = validator_class(schema)
+        # The validator's `$ref` resolver keeps a stack of resolution scopes,
+        # so it cannot be used by multiple threads at once.
+        self._lock = threading.Lock()
+
+    def validate(self, instance):
+        with self._lock:
+            error = best_match(self._validator.iter_errors(instance))
+        if error is not None:
+            raise error
+
+
 class BaseClusterTypeFactory:
     """
     BaseClusterTypeFactory is the base class for cluster type factories.  A
@@ -134,9 +168,14 @@ class BaseClusterTypeFactory:
     # Class variables overridden by subclasses.
     klass = BaseClusterType
     SCHEMA = {}
+    VALIDATOR = CompiledSchema(SCHEMA)
 
     def __init__(self, logger):
         self.logger = logger
+        # The path and stat signature, taken before it was read, of each
+        # further file that was tried whilst loading, whether or not it
+        # could be read.  A signature is None if the file was missing.
+        self.referenced = []
 
 
     def load(self, id, path, definition):
@@ -147,9 +186,18 @@ class BaseClusterTypeFactory:
         return cluster_type
 
 
+    @classmethod
+    def dependencies(cls, path, definition):
+        """
+        Return the paths of any files, other than the definition at `path`,
+        that the cluster type is loaded from.
+        """
+        return []
+
+
     def _validate(self, id, path, definition):
         try:
-            jsonschema.validate(instance=definition, schema=self.SCHEMA)
+            self.VALIDATOR.validate(definition)
         except jsonschema.ValidationError as exc:
             error_message = best_match([exc]).message
             self.logger.error(f'Loading {id}:{path} failed: {error_message}')
@@ -206,6 +254,7 @@ class MagnumClusterTypeFactory(BaseClusterTypeFactory):
         },
         "required": ["title", "description", "kind", "parameters", "magnum_cluster_template", "order", "logo_url"],
     }
+    VALIDATOR = CompiledSchema(SCHEMA)
 
     def _extract_fields(self, id, path, definition):
         fields = super()._extract_fields(id, path, definition)
@@ -241,6 +290,7 @@ class SaharaClusterTypeFactory(BaseClusterTypeFactory):
         },
         "required": ["title", "description", "kind", "parameters", "sahara_cluster_template", "order", "logo_url"],
     }
+    VALIDATOR = CompiledSchema(SCHEMA)
 
     def _extract_fields(self, id, path, definition):
         fields = super()._extract_fields(id, path, definition)
@@ -257,6 +307,10 @@ class HeatClusterTypeFactory(BaseClusterTypeFactory):
 
     klass = HeatClusterType
 
+    # Executor used to load a cluster type's components concurrently.
+    # Configured by ClusterTypeRepo; if None components are loaded serially.
+    component_executor = None
+
     SCHEMA = {
         "$defs": SCHEMA_DEFS,
         "type": "object",
@@ -296,6 +350,7 @@ class HeatClusterTypeFactory(BaseClusterTypeFactory):
         "required": ["title", "description", "kind", "components", "order", "logo_url"],
         "additionalProperties": False,
     }
+    VALIDATOR = CompiledSchema(SCHEMA)
 
     def load(self, id, path, definition):
         if not self._validate(id, path, definition):
@@ -312,21 +367,41 @@ class HeatClusterTypeFactory(BaseClusterTypeFactory):
         return cluster_type
 
 
+    @classmethod
+    def dependencies(cls, path, definition):
+        component_defs = definition.get("components")
+        if not isinstance(component_defs, list):
+            return []
+        base_dir = os.path.dirname(path)
+        return [
+            cls._component_path(base_dir, c["name"])
+            for c in component_defs
+            if isinstance(c, dict) and isinstance(c.get("name"), str)
+        ]
+
+
+    @staticmethod
+    def _component_path(base_dir, name):
+        if os.path.isabs(name):
+            return name
+        return os.path.join(base_dir, "components", f'{name}.yaml')
+
+
     def _load_components(self, base_dir, component_defs):
-        components_dir = os.path.join(base_dir, "components")
-        components = []
-        for c in component_defs:
-            path = c["name"]
-            if not os.path.isabs(path):
-                path = os.path.join(components_dir, f'{path}.yaml')
-            component = ComponentLoader(self.logger).load(path, optional=c.get("optional", False))
-            if component is None:
-                # If any component fails to load, the entire cluster type is
-                # invalid.  Return None to indicate this, the logs will have
-                # details of why.
-                return None
-            else:
-                components.append(component)
+        loader = ComponentLoader(self.logger, self.referenced)
+        def load(c):
+            return loader.load(self._component_path(base_dir, c["name"]), optional=c.get("optional", False))
+
+        executor = self.component_executor
+        if executor is None or len(component_defs) < 2:
+            components = [load(c) for c in component_defs]
+        else:
+            components = list(executor.map(load, component_defs))
+        if any(component is None for component in components):
+            # If any component fails to load, the entire cluster type is
+            # invalid.  Return None to indicate this, the logs will have
+            # details of why.
+            return None
         return components
 
 
@@ -338,8 +413,7 @@ class HeatClusterTypeFactory(BaseClusterTypeFactory):
         found_router = False
         found_network = False
         for component in components:
-            _, hot_template = template_utils.get_template_contents(component.path, fetch_child=True)
-            for resource in hot_template.get("resources", {}).values():
+            for resource in component.resources.values():
                 if resource["type"] == "OS::Neutron::Router":
                     found_router = True
                 if resource["type"] == "OS::Neutron::Net":
@@ -380,19 +454,47 @@ class ComponentLoader:
         },
         "additionalProperties": False,
     }
-
-    def __init__(self, logger):
+    VALIDATOR = CompiledSchema(SCHEMA)
+
+    # Parsed and validated component templates keyed by the SHA-256 digest of
+    # their contents.  The cluster types generated from the example templates
+    # share many byte-identical components; each distinct component is only
+    # parsed and validated once and its template shared, so cached templates
+    # must not be modified.
+    CACHE_SIZE = 1024
+    _cache = collections.OrderedDict()
+    _cache_lock = threading.Lock()
+
+    # Contents of the files referenced by components, either via `get_file`
+    # or as nested templates, keyed by path and validated against the file's
+    # modification time.
+    _file_cache = {}
+    _file_cache_lock = threading.Lock()
+
+    def __init__(self, logger, referenced=None):
         self.logger = logger
+        # The path and stat signature of each local file that references
+        # were resolved to, appended to as they are read.
+        self.referenced = [] if referenced is None else referenced
 
 
     def load(self, path, optional=False):
         try:
-            _, hot_template = template_utils.get_template_contents(path, fetch_child=True)
-            jsonschema.validate(instance=hot_template, schema=self.SCHEMA)
+            with open(path, "rb") as f:
+                content = f.read()
+            hot_template = self._parse(path, content)
+            files = {}
+            if _has_references(hot_template):
+                # Relative `get_file` and nested template references are
+                # resolved against the component's location, so the resolved
+                # template is specific to this component.
+                hot_template = copy.deepcopy(hot_template)
+                base_url = heatclientUtils.base_url_for_url(heatclientUtils.normalise_file_path_to_url(path))
+                self._resolve_references(hot_template, files, base_url)
         except heatclientExceptions.CommandError as exc:
             self.logger.error(f'Loading {path} failed: {exc}')
             return None
-        except urllib.error.URLError as exc:
+        except (FileNotFoundError, urllib.error.URLError) as exc:
             self.logger.error(f'Loading failed: component not found: {path}')
             return None
         except jsonschema.ValidationError as exc:
@@ -408,7 +510,131 @@ class ComponentLoader:
             resources=hot_template.get("resources", {}),
             conditions=hot_template.get("conditions", {}),
             outputs=hot_template.get("outputs", {}),
+            files=files,
             last_modified=datetime.datetime.fromtimestamp(os.path.getmtime(path)),
             is_optional=optional,
             name=os.path.splitext(os.path.basename(path))[0],
         )
+
+
+    def _parse(self, path, content):
+        """
+        Return the parsed and validated template for the given component file
+        contents; from the cache if the same contents have been seen before.
+        """
+        digest = hashlib.sha256(content).hexdigest()
+        with self._cache_lock:
+            hot_template = self._cache.get(digest)
+            if hot_template is not None:
+                self._cache.move_to_end(digest)
+                return hot_template
+
+        if not content.strip():
+            raise heatclientExceptions.CommandError(f'Could not fetch template from {path}')
+        try:
+            hot_template = template_format.parse(content.decode('utf-8'))
+        except ValueError as exc:
+            raise heatclientExceptions.CommandError(f'Error parsing template {path} {exc}')
+        self.VALIDATOR.validate(hot_template)
+
+        with self._cache_lock:
+            self._cache[digest] = hot_template
+            if len(self._cache) > self.CACHE_SIZE:
+                self._cache.popitem(last=False)
+        return hot_template
+
+
+    def _resolve_references(self, data, files, base_url):
+        """
+        Replace the file references in data with absolute URLs and add the
+        contents of the referenced files to files, recursing into nested
+        templates.
+
+        This produces the same template and files map as heatclient's
+        `template_utils.resolve_template_get_files`, but reads local files
+        through the file cache.
+        """
+        if isinstance(data, dict):
+            for key, value in data.items():
+                if _is_reference(key, value):
+                    url = urllib.parse.urljoin(base_url if base_url.endswith('/') else base_url + '/', value)
+                    if url not in files:
+                        files[url] = self._read_reference(url, files)
+                    data[key] = url
+                else:
+                    self._resolve_references(value, files, base_url)
+        elif isinstance(data, list):
+            for value in data:
+                self._resolve_references(value, files, base_url)
+
+
+    def _read_reference(self, url, files):
+        parsed = urllib.parse.urlparse(url)
+        if parsed.scheme == "file":
+            path = urllib.request.url2pathname(parsed.path)
+            stat, content = self._read_file(path)
+            self.referenced.append((path, stat))
+            if content is None:
+                raise heatclientExceptions.CommandError(f'Could not fetch contents for {url}')
+        else:
+            content = heatclientUtils.read_url_content(url)
+        if template_utils.is_template(content):
+            template = template_format.parse(content.decode('utf-8') if isinstance(content, bytes) else content)
+            self._resolve_references(template, files, heatclientUtils.base_url_for_url(url))
+            content = jsonutils.dumps(template)
+        return content
+
+
+    @classmethod
+    def _read_file(cls, path):
+        """
+        Return the stat signature of the file at path, taken before it is
+        read, and its contents as heatclient would send them.  The contents
+        are None if the file cannot be read, as is the signature if it does
+        not exist.
+        """
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None, None
+        stat = (st.st_mtime_ns, st.st_size, st.st_ino)
+        with cls._file_cache_lock:
+            cached = cls._file_cache.get(path)
+        if cached is not None and cached[0] == stat:
+            return cached
+        try:
+            with open(path, "rb") as f:
+                content = f.read()
+        except OSError:
+            return stat, None
+        try:
+            content.decode('utf-8')
+        except ValueError:
+            content = base64.encodebytes(content)
+        with cls._file_cache_lock:
+            cls._file_cache[path] = (stat, content)
+        return stat, content
+
+
+def _is_reference(key, value):
+    """
+    Return True if the given key and value are a reference to another file
+    that heatclient would resolve, i.e., `get_file` or a `type` naming a
+    template.
+    """
+    if not isinstance(value, str):
+        return False
+    return key == "get_file" or (key == "type" and value.endswith(('.yaml', '.template')))
+
+
+def _has_references(data):
+    """
+    Return True if the template data contains any references to other files.
+    """
+    if isinstance(data, dict):
+        for key, value in data.items():
+            if _is_reference(key, value) or _has_references(value):
+                return True
+    elif isinstance(data, list):
+        return any(_has_references(value) for value in data)
+    return False
@@ -27,8 +27,10 @@
 ==============================================================================
 """
 
-import glob
+import concurrent.futures
+import hashlib
 import os
+import threading
 import yaml
 from operator import attrgetter
 
@@ -36,13 +38,64 @@ from flask import (abort)
 from jsonschema.exceptions import (best_match)
 import jsonschema
 
-from .cluster_type_factory import (HeatClusterTypeFactory, SaharaClusterTypeFactory, MagnumClusterTypeFactory)
+from .cluster_type_factory import (CompiledSchema, HeatClusterTypeFactory, SaharaClusterTypeFactory, MagnumClusterTypeFactory)
+from .cluster_type_snapshot import ClusterTypeSnapshot
+
+
+class Catalog:
+    """
+    An immutable snapshot of the valid cluster types held by ClusterTypeRepo.
+
+    A new Catalog is created whenever a cluster type is added, changed or
+    removed; a Catalog is never modified once created.
+
+    Each cluster type has an entity tag derived from the contents and
+    modification times of the files it was loaded from.  The catalog's own
+    entity tag is derived from those of its cluster types.
+    """
+
+    def __init__(self, entries=()):
+        entries = [e for e in entries if e.cluster_type is not None]
+        self.cluster_types = sorted((e.cluster_type for e in entries), key=attrgetter('order', 'id'))
+        self.by_id = {ct.id: ct for ct in self.cluster_types}
+        self.etags = {e.cluster_type.id: e.digest for e in entries}
+        listing = "\n".join(f"{ct.id}:{self.etags[ct.id]}" for ct in self.cluster_types)
+        self.etag = hashlib.sha256(listing.encode()).hexdigest()
+
+
+class RegistryEntry:
+    """
+    The result of loading a single cluster type along with the stat
+    signature and content digest of the files it was loaded from.
+    `cluster_type` is None if the cluster type failed to load.
+    """
+
+    def __init__(self, signature, cluster_type, digest=None):
+        self.signature = signature
+        self.cluster_type = cluster_type
+        self.digest = digest
+
 
 class ClusterTypeRepo:
     """
     Loads minimal cluster type definitions from disk; minimally validates them
     and delegates to a *ClusterTypeFactory class to continue creation of a
     *ClusterType object.
+
+    Loaded cluster types are held in a process-wide registry.  A cluster type
+    is only reloaded when the stat signature of its definition or one of its
+    components changes.
+
+    If a ClusterTypeWatcher has been started with `watch`, the watcher keeps
+    the registry up to date and `all` and `find` never touch the disk.
+
+    If configured with a snapshot path, the registry is seeded from a
+    ClusterTypeSnapshot and the snapshot is rewritten whenever the registry
+    changes.
+
+    When several cluster types need (re)loading they are loaded concurrently
+    using a pool of `load_workers` threads.  A failure to load one cluster
+    type does not affect the others.
     """
 
     # JSON Schema definition for attributes common to all cluster type definition kinds.
@@ -62,16 +115,62 @@ class ClusterTypeRepo:
         },
         "required": ["title", "description", "kind"],
     }
+    VALIDATOR = CompiledSchema(SCHEMA)
 
+    DEFINITION_FILE = "cluster-type.yaml"
 
     # Class variables configured in configure method.
     # logger = None
     # types_dir = None
 
+    # The registry.  Maps cluster type id to RegistryEntry.  Guarded by _lock.
+    _entries = {}
+    _catalog = Catalog()
+    _lock = threading.RLock()
+    _watcher = None
+    _snapshot = None
+    _executor = None
+
     @classmethod
-    def configure(cls, types_dir, logger):
+    def configure(cls, types_dir, logger, snapshot_path=None, load_workers=None):
+        cls.unwatch()
         cls.types_dir = types_dir
         cls.logger = logger
+        with cls._lock:
+            cls._configure_executors(load_workers)
+            cls._entries = {}
+            cls._catalog = Catalog()
+            cls._snapshot = None
+            if snapshot_path is not None:
+                cls._snapshot = ClusterTypeSnapshot(snapshot_path, logger)
+                for id, (signature, cluster_type, digest) in cls._snapshot.load().items():
+                    cls._entries[id] = RegistryEntry(signature, cluster_type, digest)
+                # Reload anything that has changed since the snapshot was
+                # taken.  If nothing has, the snapshot is published as is.
+                seeded = cls._catalog
+                cls.refresh()
+                if cls._catalog is seeded:
+                    cls._catalog = Catalog(cls._entries.values())
+
+
+    @classmethod
+    def watch(cls, mode="auto", interval=1.0):
+        """
+        Load all cluster types and start a background ClusterTypeWatcher to
+        reload them as they change.
+        """
+        from .cluster_type_watcher import ClusterTypeWatcher
+        cls.unwatch()
+        cls.refresh()
+        cls._watcher = ClusterTypeWatcher(cls, cls.logger, mode=mode, interval=interval)
+        cls._watcher.start()
+
+
+    @classmethod
+    def unwatch(cls):
+        if cls._watcher is not None:
+            cls._watcher.stop()
+            cls._watcher = None
 
 
     @classmethod
@@ -79,15 +178,19 @@ class ClusterTypeRepo:
         """
         Return list of valid cluster types.
         """
-        cls.logger.info(f"Retrieving all cluster types")
-        types = []
-        for file in glob.glob(os.path.join(cls.types_dir, "*", "cluster-type.yaml")):
-            id = os.path.basename(os.path.dirname(file))
-            cluster_type = cls._load(id, file)
-            if cluster_type is not None:
-                types.append(cluster_type)
+        return cls.latest().cluster_types
 
-        return sorted(types, key=attrgetter('order', 'id'))
+
+    @classmethod
+    def latest(cls):
+        """
+        Return the Catalog of valid cluster types.  Unless the registry is
+        being watched, the disk is first checked for changes.
+        """
+        cls.logger.info(f"Retrieving all cluster types")
+        if cls._watcher is not None:
+            return cls._catalog
+        return cls.refresh()
 
 
     @classmethod
@@ -95,9 +198,12 @@ class ClusterTypeRepo:
         """
         Return the specified cluster type or abort with a 404.
         """
-        definition_path = os.path.join(cls.types_dir, id, "cluster-type.yaml")
-        cls.logger.info(f"Finding cluster type: {id}:{definition_path}")
-        cluster_type = cls._load(id, definition_path)
+        cls.logger.info(f"Finding cluster type: {id}")
+        cluster_type = None
+        if cls._watcher is not None:
+            cluster_type = cls._catalog.by_id.get(id)
+        elif cls._is_valid_id(id):
+            cluster_type = cls.refresh_ids([id]).by_id.get(id)
         if cluster_type is None:
             abort(404, f"Unknown cluster type: {id}")
         else:
@@ -105,31 +211,256 @@ class ClusterTypeRepo:
 
 
     @classmethod
-    def _load(cls, id, file):
+    def catalog(cls):
+        """
+        Return the current Catalog without checking for changes on disk.
+        """
+        return cls._catalog
+
+
+    @classmethod
+    def refresh(cls):
+        """
+        Bring the registry in line with the enabled cluster types on disk and
+        return the resulting Catalog.
+
+        New cluster types are loaded; cluster types whose files have changed
+        are reloaded and cluster types that are no longer enabled are dropped.
+        Cluster types whose files are unchanged are not reloaded.
+        """
+        with cls._lock:
+            stale = {}
+            found = set()
+            for id in cls.enabled_ids():
+                file = cls._definition_path(id)
+                if not os.path.isfile(file):
+                    continue
+                found.add(id)
+                if cls._is_stale(id):
+                    stale[id] = file
+            changed = cls._reload(stale)
+            for id in set(cls._entries) - found:
+                cls.logger.info(f"Cluster type {id} is no longer enabled")
+                del cls._entries[id]
+                changed = True
+            if changed:
+                cls._rebuild_catalog()
+            return cls._catalog
+
+
+    @classmethod
+    def refresh_ids(cls, ids):
+        """
+        As `refresh` but only consider the given cluster type ids.
+        """
+        with cls._lock:
+            stale = {}
+            changed = False
+            for id in ids:
+                file = cls._definition_path(id)
+                if cls._is_valid_id(id) and os.path.isfile(file):
+                    if cls._is_stale(id):
+                        stale[id] = file
+                elif cls._entries.pop(id, None) is not None:
+                    cls.logger.info(f"Cluster type {id} is no longer enabled")
+                    changed = True
+            changed = cls._reload(stale) or changed
+            if changed:
+                cls._rebuild_catalog()
+            return cls._catalog
+
+
+    @classmethod
+    def watched_paths(cls, id):
+        """
+        Return the paths that the given cluster type was loaded from.
+        """
+        entry = cls._entries.get(id)
+        if entry is None:
+            return [cls._definition_path(id)]
+        return [path for path, _ in entry.signature]
+
+
+    @classmethod
+    def enabled_ids(cls):
+        """
+        Return the ids of the directories in the enabled cluster types directory.
+        """
+        try:
+            with os.scandir(cls.types_dir) as it:
+                return [e.name for e in it if cls._is_valid_id(e.name) and e.is_dir()]
+        except FileNotFoundError:
+            return []
+
+
+    @classmethod
+    def _is_stale(cls, id):
+        """
+        Return True if the cluster type is new or its signature has changed.
+        """
+        entry = cls._entries.get(id)
+        return entry is None or entry.signature != cls._signature(path for path, _ in entry.signature)
+
+
+    @classmethod
+    def _reload(cls, stale):
+        """
+        (Re)load the given cluster types, a dict mapping id to definition
+        path, concurrently if there is more than one.  Return True if the
+        registry was modified.
+        """
+        for id, file in stale.items():
+            cls.logger.info(f"{'Reloading' if id in cls._entries else 'Loading'} cluster type: {id}:{file}")
+        if len(stale) == 1 or cls._executor is None:
+            entries = {id: cls._load_entry(id, file) for id, file in stale.items()}
+        else:
+            futures = {id: cls._executor.submit(cls._load_entry, id, file) for id, file in stale.items()}
+            entries = {}
+            for id, future in futures.items():
+                try:
+                    entries[id] = future.result()
+                except Exception as exc:
+                    # Only reachable if the worker itself failed, as
+                    # _load_entry handles errors loading the cluster type.
+                    cls.logger.exception(f"Loading {id} failed: {exc}")
+                    entries[id] = RegistryEntry(cls._signature([stale[id]]), None)
+        cls._entries.update(entries)
+        return len(entries) > 0
+
+
+    @classmethod
+    def _configure_executors(cls, load_workers):
+        if cls._executor is not None:
+            cls._executor.shutdown(wait=False, cancel_futures=True)
+        if HeatClusterTypeFactory.component_executor is not None:
+            HeatClusterTypeFactory.component_executor.shutdown(wait=False, cancel_futures=True)
+        # Threads rather than processes, so that the loaded components share
+        # ComponentLoader's cache and no locks are inherited by a fork.
+        cls._executor = concurrent.futures.ThreadPoolExecutor(load_workers, thread_name_prefix="cluster-type-loader")
+        # Components are loaded on a separate pool to the cluster types so
+        # that a cluster type waiting on its components cannot starve them of
+        # workers.
+        HeatClusterTypeFactory.component_executor = concurrent.futures.ThreadPoolExecutor(
+            load_workers, thread_name_prefix="component-loader",
+        )
+
+
+    @classmethod
+    def _rebuild_catalog(cls):
+        cls._catalog = Catalog(cls._entries.values())
+        if cls._snapshot is not None:
+            cls._snapshot.dump(cls._entries)
+
+
+    @classmethod
+    def _load_entry(cls, id, file):
+        # Each file is stat'ed before it is read so that a change made whilst
+        # loading results in a reload next time round.
+        signature = cls._signature([file])
         definition = cls._load_definition(id, file)
+        factory = None
+        if isinstance(definition, dict):
+            factory = cls._factory_for(definition.get("kind"))
+            if factory is not None:
+                signature += cls._signature(factory.dependencies(file, definition))
+        try:
+            cluster_type, referenced = cls._load(id, file, definition)
+        except Exception as exc:
+            cls.logger.exception(f"Loading {id} failed: {exc}")
+            cluster_type, referenced = None, ()
+        # Files referenced by the components are only known once they have
+        # been tried.  They are included even if the load failed, so that
+        # creating a missing file results in a reload.
+        seen = {path for path, _ in signature}
+        for path, stat in referenced:
+            if path not in seen:
+                seen.add(path)
+                signature += ((path, stat),)
+        digest = None if cluster_type is None else cls._digest(signature)
+        return RegistryEntry(signature, cluster_type, digest)
+
+
+    @staticmethod
+    def _signature(paths):
+        """
+        Return the stat signature for the given paths.  A missing file is
+        included in the signature so that its creation is noticed.
+        """
+        signature = []
+        for path in paths:
+            try:
+                st = os.stat(path)
+            except OSError:
+                signature.append((path, None))
+            else:
+                signature.append((path, (st.st_mtime_ns, st.st_size, st.st_ino)))
+        return tuple(signature)
+
+
+    @staticmethod
+    def _digest(signature):
+        """
+        Return a digest of the contents and modification times of the files
+        in the given signature.
+        """
+        digest = hashlib.sha256()
+        for path, stat in signature:
+            digest.update(f"{path}\0{stat and stat[0]}\0".encode())
+            try:
+                with open(path, "rb") as f:
+                    digest.update(f.read())
+            except OSError:
+                pass
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+
+    @classmethod
+    def _definition_path(cls, id):
+        return os.path.join(cls.types_dir, id, cls.DEFINITION_FILE)
+
+
+    @staticmethod
+    def _is_valid_id(id):
+        # Only directories directly within types_dir can be cluster types.
+        # Hidden directories are ignored.
+        return bool(id) and os.path.basename(id) == id and not id.startswith(".")
+
+
+    @staticmethod
+    def _factory_for(kind):
+        match kind:
+            case "heat":
+                return HeatClusterTypeFactory
+            case "magnum":
+                return MagnumClusterTypeFactory
+            case "sahara":
+                return SaharaClusterTypeFactory
+        return None
+
+
+    @classmethod
+    def _load(cls, id, file, definition):
+        """
+        Return the loaded cluster type, or None, and the path and stat
+        signature of each further file its factory tried to read.
+        """
         if definition is None:
-            return
+            return None, ()
         try:
-            jsonschema.validate(instance=definition, schema=cls.SCHEMA)
+            cls.VALIDATOR.validate(definition)
         except jsonschema.ValidationError as exc:
             error_message = best_match([exc]).message
             cls.logger.error(f'Loading {id} failed: {error_message}')
             cls.logger.debug(f'Loading {id} failed: {exc}')
-            return None
+            return None, ()
         else:
-            factory = None
-            match definition["kind"]:
-                case "heat":
-                    factory = HeatClusterTypeFactory
-                case "magnum":
-                    factory = MagnumClusterTypeFactory
-                case "sahara":
-                    factory = SaharaClusterTypeFactory
-
-            if factory == None:
+            factory_class = cls._factory_for(definition["kind"])
+            if factory_class == None:
                 cls.logger.error(f'Unhandled cluster type kind {definition["kind"]}')
-            else:
-                return factory(cls.logger).load(id, file, definition)
+                return None, ()
+            factory = factory_class(cls.logger)
+            return factory.load(id, file, definition), tuple(factory.referenced)
 
 
     @classmethod
@@ -145,3 +476,4 @@ class ClusterTypeRepo:
         except FileNotFoundError as exc:
             cls.logger.error(f'Loading {id} failed: FileNotFoundError: {file}')
             return None
+
@@ -0,0 +1,156 @@
+"""
+==============================================================================
+ Copyright (C) 2024-present Alces Flight Ltd.
+
+ This file is part of Concertim Cluster Builder.
+
+ This program and the accompanying materials are made available under
+ the terms of the Eclipse Public License 2.0 which is available at
+ <https://www.eclipse.org/legal/epl-2.0>, or alternative license
+ terms made available by Alces Flight Ltd - please direct inquiries
+ about licensing to licensing@alces-flight.com.
+
+ Concertim Visualisation App is distributed in the hope that it will be useful, but
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, EITHER EXPRESS OR
+ IMPLIED INCLUDING, WITHOUT LIMITATION, ANY WARRANTIES OR CONDITIONS
+ OF TITLE, NON-INFRINGEMENT, MERCHANTABILITY OR FITNESS FOR A
+ PARTICULAR PURPOSE. See the Eclipse Public License 2.0 for more
+ details.
+
+ You should have received a copy of the Eclipse Public License 2.0
+ along with Concertim Visualisation App. If not, see:
+
+  https://opensource.org/licenses/EPL-2.0
+
+ For more information on Concertim Cluster Builder, please visit:
+ https://github.com/openflighthpc/concertim-cluster-builder
+==============================================================================
+"""
+
+import dataclasses
+import datetime
+import hashlib
+import os
+import tempfile
+
+import msgpack
+
+from .cluster_type import (SaharaClusterType, MagnumClusterType, HeatClusterType, Component, Instruction)
+
+# Increment when the cluster type classes or their loading changes in a way
+# that makes existing snapshots invalid.
+SNAPSHOT_VERSION = 3
+
+CLASSES = {klass.__name__: klass for klass in (SaharaClusterType, MagnumClusterType, HeatClusterType, Component, Instruction)}
+
+EXT_DATETIME = 1
+EXT_DATACLASS = 2
+EXT_TEMPLATE = 3
+
+# The fields of a Component holding its parsed template.  Components with
+# identical templates share them when loaded, see ComponentLoader, and so
+# also when loaded from a snapshot.
+TEMPLATE_FIELDS = ("parameters", "resources", "conditions", "outputs")
+
+
+class ClusterTypeSnapshot:
+    """
+    A compiled, binary snapshot of the cluster type registry.
+
+    The snapshot contains the loaded and validated cluster types, along with
+    the stat signatures and digests of the files they were loaded from.
+    Loading a snapshot avoids re-parsing and re-validating those files; it is
+    the registry's job to check the signatures and reload any cluster types
+    whose files have changed.
+    """
+
+    def __init__(self, path, logger):
+        self.path = path
+        self.logger = logger
+
+    def load(self):
+        """
+        Return a dict mapping cluster type id to a tuple of (signature,
+        cluster_type, digest).  An empty dict is returned if the snapshot is
+        missing or invalid.
+        """
+        try:
+            with open(self.path, "rb") as f:
+                data = _unpackb(f.read(), _ext_hook({}))
+        except FileNotFoundError:
+            return {}
+        except Exception as exc:
+            self.logger.warning(f"Ignoring cluster type snapshot {self.path}: {exc}")
+            return {}
+        if not isinstance(data, dict) or data.get("version") != SNAPSHOT_VERSION:
+            self.logger.info(f"Ignoring cluster type snapshot {self.path}: incompatible version")
+            return {}
+        entries = {}
+        for id, (signature, cluster_type, digest) in data["entries"].items():
+            signature = tuple((path, None if stat is None else tuple(stat)) for path, stat in signature)
+            entries[id] = (signature, cluster_type, digest)
+        self.logger.info(f"Loaded {len(entries)} cluster types from snapshot {self.path}")
+        return entries
+
+    def dump(self, entries):
+        """
+        Atomically write the given entries to the snapshot.  `entries` is a
+        dict mapping cluster type id to RegistryEntry.
+        """
+        data = {
+            "version": SNAPSHOT_VERSION,
+            "entries": {
+                id: (entry.signature, entry.cluster_type, entry.digest)
+                for id, entry in entries.items()
+            },
+        }
+        try:
+            packed = msgpack.packb(data, default=_default)
+            dir = os.path.dirname(self.path)
+            with tempfile.NamedTemporaryFile(dir=dir, prefix=".snapshot-", delete=False) as tf:
+                tf.write(packed)
+            os.replace(tf.name, self.path)
+        except Exception as exc:
+            self.logger.warning(f"Writing cluster type snapshot {self.path} failed: {exc}")
+        else:
+            self.logger.debug(f"Wrote {len(entries)} cluster types to snapshot {self.path}")
+
+
+def _default(obj):
+    if isinstance(obj, datetime.datetime):
+        return msgpack.ExtType(EXT_DATETIME, obj.isoformat().encode())
+    if dataclasses.is_dataclass(obj) and type(obj).__name__ in CLASSES:
+        fields = {f.name: getattr(obj, f.name) for f in dataclasses.fields(obj)}
+        if isinstance(obj, Component):
+            template = {name: fields.pop(name) for name in TEMPLATE_FIELDS}
+            fields["template"] = msgpack.ExtType(EXT_TEMPLATE, msgpack.packb(template, default=_default))
+        return msgpack.ExtType(EXT_DATACLASS, msgpack.packb((type(obj).__name__, fields), default=_default))
+    raise TypeError(f"Cannot snapshot object of type {type(obj).__name__}")
+
+
+def _unpackb(data, ext_hook):
+    return msgpack.unpackb(data, ext_hook=ext_hook, strict_map_key=False)
+
+
+def _ext_hook(templates):
+    """
+    Return an ext hook for unpacking a snapshot.  Identical component
+    templates are unpacked once, keyed by the digest of their packed form in
+    `templates`, and shared by the components that have them.
+    """
+    def ext_hook(code, data):
+        if code == EXT_DATETIME:
+            return datetime.datetime.fromisoformat(data.decode())
+        if code == EXT_TEMPLATE:
+            digest = hashlib.sha256(data).digest()
+            template = templates.get(digest)
+            if template is None:
+                template = templates[digest] = _unpackb(data, ext_hook)
+            return template
+        if code == EXT_DATACLASS:
+            name, fields = _unpackb(data, ext_hook)
+            if name == Component.__name__:
+                fields.update(fields.pop("template"))
+            return CLASSES[name](**fields)
+        return msgpack.ExtType(code, data)
+    return ext_hook
@@ -0,0 +1,194 @@
+"""
+==============================================================================
+ Copyright (C) 2024-present Alces Flight Ltd.
+
+ This file is part of Concertim Cluster Builder.
+
+ This program and the accompanying materials are made available under
+ the terms of the Eclipse Public License 2.0 which is available at
+ <https://www.eclipse.org/legal/epl-2.0>, or alternative license
+ terms made available by Alces Flight Ltd - please direct inquiries
+ about licensing to licensing@alces-flight.com.
+
+ Concertim Visualisation App is distributed in the hope that it will be useful, but
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, EITHER EXPRESS OR
+ IMPLIED INCLUDING, WITHOUT LIMITATION, ANY WARRANTIES OR CONDITIONS
+ OF TITLE, NON-INFRINGEMENT, MERCHANTABILITY OR FITNESS FOR A
+ PARTICULAR PURPOSE. See the Eclipse Public License 2.0 for more
+ details.
+
+ You should have received a copy of the Eclipse Public License 2.0
+ along with Concertim Visualisation App. If not, see:
+
+  https://opensource.org/licenses/EPL-2.0
+
+ For more information on Concertim Cluster Builder, please visit:
+ https://github.com/openflighthpc/concertim-cluster-builder
+==============================================================================
+"""
+
+import os
+import threading
+
+# Filesystems on which inotify events for changes made on the host are not
+# delivered to the container, e.g., Docker Desktop volume mounts or network
+# filesystems.
+NON_INOTIFY_FILESYSTEMS = {
+    "9p", "cifs", "fakeowner", "fuse.grpcfuse", "fuse.osxfs", "fuse.sshfs",
+    "nfs", "nfs4", "smb3", "vboxsf", "virtiofs",
+}
+
+
+class ClusterTypeWatcher:
+    """
+    Watches the enabled cluster types directory and incrementally reloads
+    changed cluster types in a ClusterTypeRepo.
+
+    Supported modes are:
+
+    * `inotify`: use pyinotify to be notified of changes to the enabled
+      directory and to the (possibly symlinked) directories of each enabled
+      cluster type.
+    * `poll`: periodically compare the stat signatures of all cluster types.
+    * `auto`: use `inotify` if pyinotify is available and the watched
+      directories are on a filesystem that delivers inotify events; `poll`
+      otherwise.
+    """
+
+    def __init__(self, repo, logger, mode="auto", interval=1.0):
+        self.repo = repo
+        self.logger = logger
+        self.mode = mode
+        self.interval = interval
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        mode = self.mode
+        if mode in ("auto", "inotify"):
+            inotify = self._inotify_unavailable_reason()
+            if inotify is not None:
+                self.logger.warning(f"Not using inotify to watch cluster types: {inotify}")
+                mode = "poll"
+            else:
+                mode = "inotify"
+        if mode == "inotify":
+            target = self._run_inotify
+        elif mode == "poll":
+            target = self._run_poll
+        else:
+            raise ValueError(f"Unknown cluster type watch mode '{self.mode}'")
+        self.logger.info(f"Watching cluster types in {self.repo.types_dir} using {mode}")
+        self._thread = threading.Thread(target=target, name="cluster-type-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def _run_poll(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.repo.refresh()
+            except Exception as exc:
+                self.logger.exception(f"Polling cluster types failed: {exc}")
+
+    def _run_inotify(self):
+        import pyinotify
+
+        dirty = set()
+        roots = {}
+        wm = pyinotify.WatchManager()
+        mask = (pyinotify.IN_CREATE | pyinotify.IN_DELETE | pyinotify.IN_MODIFY |
+                pyinotify.IN_CLOSE_WRITE | pyinotify.IN_MOVED_FROM | pyinotify.IN_MOVED_TO |
+                pyinotify.IN_ATTRIB | pyinotify.IN_DELETE_SELF)
+        types_dir = os.path.realpath(self.repo.types_dir)
+
+        def watch(id):
+            # Cluster types are typically symlinks into cluster-types-available
+            # so the real paths are watched.  Components can be given as
+            # absolute paths so their directories are watched too.
+            dirs = {os.path.realpath(os.path.join(self.repo.types_dir, id))}
+            for path in self.repo.watched_paths(id):
+                dirs.add(os.path.dirname(os.path.realpath(path)))
+            for dir in dirs - roots.get(id, set()):
+                if os.path.isdir(dir):
+                    wm.add_watch(dir, mask, rec=True, auto_add=True)
+            roots[id] = dirs
+
+        def process(event):
+            path = os.path.realpath(event.path)
+            if path == types_dir:
+                if event.name:
+                    dirty.add(event.name)
+                return
+            for id, dirs in roots.items():
+                if any(path == dir or path.startswith(dir + os.sep) for dir in dirs):
+                    dirty.add(id)
+
+        wm.add_watch(types_dir, mask)
+        for id in self.repo.enabled_ids():
+            watch(id)
+        # Pick up any changes made before the watches were in place.
+        self.repo.refresh()
+        notifier = pyinotify.Notifier(wm, default_proc_fun=process, timeout=int(self.interval * 1000))
+        try:
+            while not self._stopped.is_set():
+                if notifier.check_events():
+                    notifier.read_events()
+                    notifier.process_events()
+                    # Let a burst of events settle before reloading.
+                    while notifier.check_events(timeout=100):
+                        notifier.read_events()
+                        notifier.process_events()
+                if dirty:
+                    ids = sorted(dirty)
+                    dirty.clear()
+                    # New directories are watched before reloading so that
+                    # files written to them in the meantime are not missed.
+                    for id in ids:
+                        watch(id)
+                    try:
+                        self.repo.refresh_ids(ids)
+                    except Exception as exc:
+                        self.logger.exception(f"Reloading cluster types {ids} failed: {exc}")
+                    for id in ids:
+                        watch(id)
+        finally:
+            notifier.stop()
+
+    def _inotify_unavailable_reason(self):
+        try:
+            import pyinotify  # noqa: F401
+        except ImportError as exc:
+            return f"pyinotify not available: {exc}"
+        dirs = [self.repo.types_dir]
+        dirs.extend(os.path.join(self.repo.types_dir, id) for id in self.repo.enabled_ids())
+        for dir in dirs:
+            fstype = filesystem_type(dir)
+            if fstype in NON_INOTIFY_FILESYSTEMS:
+                return f"{dir} is on a {fstype} filesystem"
+        return None
+
+
+def filesystem_type(path):
+    """
+    Return the type of the filesystem that `path` resides on, or None if it
+    cannot be determined.
+    """
+    path = os.path.realpath(path)
+    best, fstype = "", None
+    try:
+        with open("/proc/mounts") as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) < 3:
+                    continue
+                mount_point = fields[1].replace("\\040", " ")
+                if path == mount_point or path.startswith(mount_point.rstrip("/") + "/"):
+                    if len(mount_point) > len(best):
+                        best, fstype = mount_point, fields[2]
+    except OSError:
+        return None
+    return fstype
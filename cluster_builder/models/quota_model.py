@@ -0,0 +1,127 @@
+"""
+==============================================================================
+ Copyright (C) 2024-present Alces Flight Ltd.
+
+ This file is part of Concertim Cluster Builder.
+
+ This program and the accompanying materials are made available under
+ the terms of the Eclipse Public License 2.0 which is available at
+ <https://www.eclipse.org/legal/epl-2.0>, or alternative license
+ terms made available by Alces Flight Ltd - please direct inquiries
+ about licensing to licensing@alces-flight.com.
+
+ Concertim Visualisation App is distributed in the hope that it will be useful, but
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, EITHER EXPRESS OR
+ IMPLIED INCLUDING, WITHOUT LIMITATION, ANY WARRANTIES OR CONDITIONS
+ OF TITLE, NON-INFRINGEMENT, MERCHANTABILITY OR FITNESS FOR A
+ PARTICULAR PURPOSE. See the Eclipse Public License 2.0 for more
+ details.
+
+ You should have received a copy of the Eclipse Public License 2.0
+ along with Concertim Visualisation App. If not, see:
+
+  https://opensource.org/licenses/EPL-2.0
+
+ For more information on Concertim Cluster Builder, please visit:
+ https://github.com/openflighthpc/concertim-cluster-builder
+==============================================================================
+"""
+
+from dataclasses import dataclass
+import json
+
+
+@dataclass(frozen=True)
+class QuotaTerm:
+    """
+    QuotaTerm is the quota cost of a single server or volume resource.
+
+    `value` is the resource's flavor or size property, and `multipliers` are
+    the count properties of any enclosing resource groups.  Each is either a
+    literal value or a `{"get_param": name}` reference.
+    """
+    kind: str
+    value: object
+    multipliers: tuple
+
+
+class QuotaModel:
+    """
+    QuotaModel is the quota cost of a HOT template compiled into a list of
+    terms, so that the quota needed for a launch can be evaluated against the
+    given parameters without walking the template or reading any nested
+    templates.
+    """
+
+    def __init__(self, terms):
+        self.terms = tuple(terms)
+
+
+    @classmethod
+    def compile(cls, resources, files):
+        """
+        Compile the given HOT resources.  `files` is the files map for the
+        template, from which nested resource group templates are read.
+        """
+        return cls(cls._compile(resources, files, ()))
+
+
+    @classmethod
+    def _compile(cls, resources, files, multipliers):
+        terms = []
+        for resource in resources.values():
+            if resource["type"] == "OS::Nova::Server":
+                terms.append(QuotaTerm(kind="server", value=_property(resource, "flavor"), multipliers=multipliers))
+            elif resource["type"] == "OS::Cinder::Volume":
+                terms.append(QuotaTerm(kind="volume", value=_property(resource, "size"), multipliers=multipliers))
+            elif resource["type"] == "OS::Heat::ResourceGroup":
+                resource_def = resource["properties"]["resource_def"]
+                nested = files.get(resource_def["type"])
+                if nested is not None:
+                    group_resources = json.loads(nested)["resources"]
+                else:
+                    group_resources = {"resource_def": resource_def}
+                group_multipliers = multipliers + (_property(resource, "count"),)
+                terms.extend(cls._compile(group_resources, files, group_multipliers))
+        return terms
+
+
+    def evaluate(self, parameters, flavor_details):
+        """
+        Return the quota counts needed to launch with the given parameters.
+        `flavor_details` is a callable returning a dict with the `ram` and
+        `vcpus` of the named flavor.
+        """
+        instances = 0
+        volumes = 0
+        ram = 0
+        vcpus = 0
+        volume_disk = 0
+        flavors = {}
+        for term in self.terms:
+            multiplier = 1
+            for count in term.multipliers:
+                multiplier *= int(_resolve(parameters, count)) or 1
+            if term.kind == "server":
+                flavor_name = _resolve(parameters, term.value)
+                if flavor_name not in flavors:
+                    flavors[flavor_name] = flavor_details(flavor_name)
+                details = flavors[flavor_name]
+                instances += multiplier
+                ram += details["ram"] * multiplier
+                vcpus += details["vcpus"] * multiplier
+            else:
+                volumes += multiplier
+                volume_disk += int(_resolve(parameters, term.value)) * multiplier
+        return { "instances": instances, "volumes": volumes, "ram": ram, "vcpus": vcpus, "volume_disk": volume_disk }
+
+
+def _property(resource, name):
+    return resource.get("properties", {}).get(name)
+
+
+def _resolve(parameters, value):
+    if type(value) is dict:
+        return parameters[value["get_param"]]
+    else:
+        return value
@@ -57,19 +57,8 @@ def remove_unwanted_answers(cluster_type, selections, answers):
     Filter answers to remove any that are for a parameter only defined in a
     de-selected optional component.
     """
-    filtered_answers = {}
-    filtered_parameter_ids = []
-    for component in cluster_type.components:
-        is_selected = selections.get(component.name, False)
-        if component.is_optional and not is_selected:
-            continue
-        for id in component.parameters:
-            if id not in filtered_parameter_ids:
-                filtered_parameter_ids.append(id)
-    for id, answer in answers.items():
-        if id in filtered_parameter_ids:
-            filtered_answers[id] = answer
-    return filtered_answers
+    parameters = cluster_type.parameters_for(selections)
+    return {id: answer for id, answer in answers.items() if id in parameters}
 
 
 def assert_parameters_present(cluster_type, answers):
@@ -27,14 +27,127 @@
 ==============================================================================
 """
 
+import collections
+import contextlib
+import hashlib
+import http.cookiejar
+import hmac
+import json
+import secrets
+import threading
+import time
+
 # Openstack Packages
 from keystoneauth1.identity import v2, v3
+from keystoneauth1 import exceptions as ks_exceptions
 from keystoneauth1 import session
+import requests
+import requests.adapters
+
+def build_http_session(pool_maxsize=10, pool_sizes=None):
+    """
+    Return a requests session, shared by all keystone sessions, whose
+    connection pools keep connections to the OpenStack endpoints alive across
+    requests and projects.
+
+    `pool_maxsize` is the number of connections kept per endpoint host, and
+    `pool_sizes` maps `host` or `host:port` to the number of connections to
+    keep for that host instead.
+    """
+    http_session = requests.Session()
+    # The session is shared by requests made with different credentials, so
+    # it must not hold on to any cookies.
+    http_session.cookies.set_policy(http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+    adapter = requests.adapters.HTTPAdapter(pool_connections=32, pool_maxsize=pool_maxsize)
+    http_session.mount("http://", adapter)
+    http_session.mount("https://", adapter)
+    for host, size in (pool_sizes or {}).items():
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=int(size))
+        http_session.mount(f"http://{host}/", adapter)
+        http_session.mount(f"https://{host}/", adapter)
+        if ":" not in host:
+            http_session.mount(f"http://{host}:", adapter)
+            http_session.mount(f"https://{host}:", adapter)
+    return http_session
+
+
+# Per-thread overrides of the timeout of requests made by a CachedSession.
+_request_timeouts = threading.local()
+
+
+@contextlib.contextmanager
+def request_timeout(timeout):
+    """
+    Make each request sent through a CachedSession by this thread, within the
+    block, time out after `timeout` seconds without a response rather than
+    after the session's timeout.
+    """
+    previous = getattr(_request_timeouts, "timeout", None)
+    _request_timeouts.timeout = timeout
+    try:
+        yield
+    finally:
+        _request_timeouts.timeout = previous
+
+
+class DiscoveryCache:
+    """
+    A thread-safe cache of keystoneauth version discovery results, keyed by
+    endpoint URL, shared by all sessions so that only the first request to a
+    service pays for version discovery.
+
+    keystoneauth stores each result it uses back into the cache, so an entry
+    expires `ttl` seconds after the result was first fetched, not after it
+    was last used.
+    """
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, url, default=None):
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is None:
+                return default
+            if time.monotonic() - entry[0] >= self.ttl:
+                del self._entries[url]
+                return default
+            return entry[1]
+
+    def __setitem__(self, url, discovery):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is None or entry[1] is not discovery or now - entry[0] >= self.ttl:
+                self._entries[url] = (now, discovery)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
 
 class OpenStackAuth:
+    # Authenticated sessions, keyed by a fingerprint of the credentials they
+    # were created from, are reused across requests.  The session's auth
+    # plugin reuses its token until shortly before it expires and then
+    # re-authenticates, so this saves a keystone authentication per request.
+    cache_size = 64
+    _sessions = collections.OrderedDict()
+    _lock = threading.Lock()
+    # The fingerprints are keyed with a per-process secret so that they cannot
+    # be used to test guesses of the credentials.
+    _fingerprint_key = secrets.token_bytes(32)
+    discovery_cache = DiscoveryCache(300.0)
+    http_session = build_http_session()
+
     def __init__(self, auth_dict, logger):
         self.auth_dict = auth_dict
         self.auth_methods = {
+            v3.Token: [
+                {'auth_url', 'token', 'project_id'},
+                {'auth_url', 'token', 'project_name', 'project_domain_name'}
+            ],
             v3.Password: [
                 {'auth_url', 'user_id', 'password', 'project_id'},
                 {'auth_url', 'username', 'password', 'project_id', 'user_domain_name'},
@@ -48,15 +161,82 @@ class OpenStackAuth:
         }
         self.logger = logger
 
+    @classmethod
+    def configure(cls, cache_size, discovery_ttl=300.0, pool_maxsize=10, pool_sizes=None):
+        with cls._lock:
+            cls.cache_size = cache_size
+            cls._sessions = collections.OrderedDict()
+            cls.discovery_cache = DiscoveryCache(discovery_ttl)
+            cls.http_session = build_http_session(pool_maxsize, pool_sizes)
+
     def get_session(self):
+        method = self.__auth_method()
+        fingerprint = self.fingerprint()
+        with self._lock:
+            sess = self._sessions.get(fingerprint)
+            if sess is not None:
+                self._sessions.move_to_end(fingerprint)
+                return sess
+        self.__log()
+        sess = CachedSession(fingerprint, auth=method(**self.auth_dict), timeout=30,
+                             discovery_cache=self.discovery_cache, session=self.http_session)
+        if self.cache_size > 0:
+            with self._lock:
+                self._sessions[fingerprint] = sess
+                while len(self._sessions) > self.cache_size:
+                    self._sessions.popitem(last=False)
+        return sess
+
+    def fingerprint(self):
+        """
+        Return a fingerprint of the credentials in the auth dict.
+        """
+        credentials = json.dumps(sorted(self.auth_dict.items())).encode()
+        return hmac.new(self._fingerprint_key, credentials, hashlib.sha256).hexdigest()
+
+    @classmethod
+    def evict(cls, fingerprint, sess=None):
+        """
+        Remove the session cached for the given fingerprint.  If `sess` is
+        given, it is only removed if it is the cached session.
+        """
+        with cls._lock:
+            if sess is None or cls._sessions.get(fingerprint) is sess:
+                cls._sessions.pop(fingerprint, None)
+
+    def __auth_method(self):
+        if {'token', 'password'}.issubset(self.auth_dict.keys()):
+            raise ValueError("Invalid auth_dict provided. It must not contain both a token and a password")
         for method, required_params_list in self.auth_methods.items():
             for required_params in required_params_list:
                 if required_params.issubset(self.auth_dict.keys()):
-                    self.__log()
-                    return session.Session(auth=method(**self.auth_dict), timeout=30)
+                    return method
         raise ValueError(f"Invalid auth_dict provided. It must contain one of the valid sets of parameters: {self.auth_methods}")
 
     def __log(self):
-        sanitized = {k: self.auth_dict[k] for k in self.auth_dict.keys() if not k == "password"}
+        sanitized = {k: self.auth_dict[k] for k in self.auth_dict.keys() if k not in ("password", "token")}
         self.logger.debug(f'getting openstack session {sanitized}')
 
+
+class CachedSession(session.Session):
+    """
+    A keystoneauth session that removes itself from the session cache when a
+    request is unauthorized, e.g., because the credentials have been changed
+    or the token has been revoked.
+    """
+    def __init__(self, fingerprint, **kwargs):
+        super().__init__(**kwargs)
+        self.fingerprint = fingerprint
+
+    def request(self, *args, **kwargs):
+        timeout = getattr(_request_timeouts, "timeout", None)
+        if timeout is not None:
+            kwargs.setdefault("timeout", timeout)
+        try:
+            response = super().request(*args, **kwargs)
+        except ks_exceptions.Unauthorized:
+            OpenStackAuth.evict(self.fingerprint, self)
+            raise
+        if response.status_code == 401:
+            OpenStackAuth.evict(self.fingerprint, self)
+        return response
@@ -43,6 +43,11 @@ class ProjectLimitError(Exception):
         self.message = msg
         self.http_status = 400
 
+class FlavorNotFoundError(Exception):
+    def __init__(self, msg):
+        self.message = msg
+        self.http_status = 400
+
 def setup_error_handling(app):
     """
     Configure the given Flask app with error handling for openstack exceptions.
@@ -78,10 +83,24 @@ def setup_error_handling(app):
 
     # For handling custom exceptions:
     _register_error_handler(app, ProjectLimitError, ProjectLimitErrorHandler)
+    _register_error_handler(app, FlavorNotFoundError, FlavorNotFoundErrorHandler)
 
     app.logger.debug("done configuring error handlers")
 
 
+def json_api_error(error, status=None):
+    """
+    Return a JSON:API error object for an error that is reported as part of a
+    response or a job, rather than causing the request to fail.
+    """
+    if status is None:
+        status = getattr(error, "http_status", None) or getattr(error, "code", None)
+    if not isinstance(status, int):
+        status = 500
+    detail = getattr(error, "message", None) or getattr(error, "description", None) or str(error)
+    return {"status": str(status), "title": error.__class__.__name__, "detail": str(detail)}
+
+
 def _register_error_handler(app, exc, handler):
     app.logger.debug(f"{exc.__module__}.{exc.__qualname__} -> {handler.__name__}")
     app.register_error_handler(exc, handler())
@@ -226,3 +245,6 @@ class SaharaHttpErrorHandler(BaseErrorHandler):
 
 class ProjectLimitErrorHandler(BaseErrorHandler):
     pass
+
+class FlavorNotFoundErrorHandler(BaseErrorHandler):
+    pass
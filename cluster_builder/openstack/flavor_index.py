@@ -0,0 +1,114 @@
+"""
+==============================================================================
+ Copyright (C) 2024-present Alces Flight Ltd.
+
+ This file is part of Concertim Cluster Builder.
+
+ This program and the accompanying materials are made available under
+ the terms of the Eclipse Public License 2.0 which is available at
+ <https://www.eclipse.org/legal/epl-2.0>, or alternative license
+ terms made available by Alces Flight Ltd - please direct inquiries
+ about licensing to licensing@alces-flight.com.
+
+ Concertim Visualisation App is distributed in the hope that it will be useful, but
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, EITHER EXPRESS OR
+ IMPLIED INCLUDING, WITHOUT LIMITATION, ANY WARRANTIES OR CONDITIONS
+ OF TITLE, NON-INFRINGEMENT, MERCHANTABILITY OR FITNESS FOR A
+ PARTICULAR PURPOSE. See the Eclipse Public License 2.0 for more
+ details.
+
+ You should have received a copy of the Eclipse Public License 2.0
+ along with Concertim Visualisation App. If not, see:
+
+  https://opensource.org/licenses/EPL-2.0
+
+ For more information on Concertim Cluster Builder, please visit:
+ https://github.com/openflighthpc/concertim-cluster-builder
+==============================================================================
+"""
+
+import copy
+import threading
+import time
+
+from .error_handling import FlavorNotFoundError
+from .nova_handler import NovaHandler
+
+class FlavorIndex:
+    """
+    FlavorIndex maps flavor names to the flavor details needed for quota
+    checks.
+    """
+    def __init__(self, flavors):
+        self._details = {}
+        for flavor in flavors:
+            # As with a linear search, the first flavor with a given name wins.
+            self._details.setdefault(flavor.name, {"ram": flavor.ram, "vcpus": flavor.vcpus, "disk": flavor.disk})
+        self._reload = None
+
+    def __contains__(self, name):
+        return name in self._details
+
+    def __len__(self):
+        return len(self._details)
+
+    def details(self, name):
+        if name not in self._details and self._reload is not None:
+            # The flavor may have been created since the index was built.
+            return self._reload().details(name)
+        try:
+            return self._details[name]
+        except KeyError:
+            raise FlavorNotFoundError(f"flavor '{name}' not found")
+
+    def reloading(self, reload):
+        """
+        Return a copy of the index that, when a flavor is not found, looks it
+        up in the fresh index returned by calling reload.
+        """
+        index = copy.copy(self)
+        index._reload = reload
+        return index
+
+
+class FlavorIndexCache:
+    """
+    FlavorIndexCache caches the flavor index for each cloud and project, so
+    that the flavors are not listed on every launch.
+    """
+    ttl = 300.0
+    _entries = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def configure(cls, ttl):
+        with cls._lock:
+            cls.ttl = ttl
+            cls._entries = {}
+
+    @classmethod
+    def get(cls, sess, logger):
+        """
+        Return the flavor index for the project the given session is scoped
+        to, listing the flavors if there is no index younger than the TTL.
+
+        If a flavor is not found in a cached index, the flavors are listed
+        again before it is reported as not found.
+        """
+        key = (sess.auth.auth_url, sess.get_project_id())
+        now = time.monotonic()
+        with cls._lock:
+            entry = cls._entries.get(key)
+        if entry is not None and now - entry[0] < cls.ttl:
+            return entry[1].reloading(lambda: cls._list(key, sess, logger))
+        return cls._list(key, sess, logger)
+
+    @classmethod
+    def _list(cls, key, sess, logger):
+        now = time.monotonic()
+        index = FlavorIndex(NovaHandler(sess, logger).list_flavors())
+        logger.debug(f"indexed {len(index)} flavors for {key}")
+        with cls._lock:
+            cls._entries = {k: v for k, v in cls._entries.items() if now - v[0] < cls.ttl}
+            cls._entries[key] = (now, index)
+        return index
@@ -52,6 +52,19 @@ class GlanceHandler:
         raise Exception("Failed to create Glance client after multiple attempts.")
 
 
-    def list_images(self):
-        return self.glance.images.list()
+    def list_images(self, status="active", visibility=None, page_size=None):
+        """
+        Return an iterator over the images with the given status, and
+        visibility if given, fetching them a page at a time.  By default, only
+        active images, i.e., those that can be used, are listed.
+        """
+        filters = {}
+        if status is not None:
+            filters["status"] = status
+        if visibility is not None:
+            filters["visibility"] = visibility
+        kwargs = {"filters": filters}
+        if page_size is not None:
+            kwargs["page_size"] = page_size
+        return self.glance.images.list(**kwargs)
 
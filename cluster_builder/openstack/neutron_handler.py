@@ -59,7 +59,9 @@ class NeutronHandler:
 
     def list_networks(self):
         networks = []
-        for network in self.neutron.list_networks()["networks"]:
+        # Only fetch the fields we use.
+        fields = ["id", "name", "router:external"]
+        for network in self.neutron.list_networks(fields=fields)["networks"]:
             kwargs = {"id": network["id"], "name": network["name"], "external": network["router:external"]}
             networks.append(Network(**kwargs))
         return networks
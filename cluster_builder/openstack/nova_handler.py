@@ -52,8 +52,9 @@ class NovaHandler:
         raise Exception("Failed to create Nova client after multiple attempts.")
 
 
-    def list_flavors(self):
-        return self.nova.flavors.list()
+    def list_flavors(self, detailed=True):
+        # Without details, flavors only have their id and name.
+        return self.nova.flavors.list(detailed=detailed)
 
     def list_keypairs(self):
         return self.nova.keypairs.list()
@@ -0,0 +1,111 @@
+"""
+==============================================================================
+ Copyright (C) 2024-present Alces Flight Ltd.
+
+ This file is part of Concertim Cluster Builder.
+
+ This program and the accompanying materials are made available under
+ the terms of the Eclipse Public License 2.0 which is available at
+ <https://www.eclipse.org/legal/epl-2.0>, or alternative license
+ terms made available by Alces Flight Ltd - please direct inquiries
+ about licensing to licensing@alces-flight.com.
+
+ Concertim Visualisation App is distributed in the hope that it will be useful, but
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, EITHER EXPRESS OR
+ IMPLIED INCLUDING, WITHOUT LIMITATION, ANY WARRANTIES OR CONDITIONS
+ OF TITLE, NON-INFRINGEMENT, MERCHANTABILITY OR FITNESS FOR A
+ PARTICULAR PURPOSE. See the Eclipse Public License 2.0 for more
+ details.
+
+ You should have received a copy of the Eclipse Public License 2.0
+ along with Concertim Visualisation App. If not, see:
+
+  https://opensource.org/licenses/EPL-2.0
+
+ For more information on Concertim Cluster Builder, please visit:
+ https://github.com/openflighthpc/concertim-cluster-builder
+==============================================================================
+"""
+
+from concurrent.futures import (FIRST_COMPLETED, ThreadPoolExecutor, wait)
+import os
+import threading
+
+
+class StageGraph:
+    """
+    StageGraph runs a small graph of dependent stages, running independent
+    stages concurrently on a shared bounded pool.
+
+    Each stage is a callable given the results of the stages it depends on,
+    in order.  The graph fails fast: as soon as any stage raises, stages that
+    have not started are cancelled and the exception is raised to the caller
+    of `run`.  Stages that are already running are left to finish in the
+    background and their results discarded.
+    """
+    _executor = None
+    _lock = threading.Lock()
+
+    def __init__(self, logger):
+        self.logger = logger
+        self.stages = {}
+
+
+    @classmethod
+    def configure(cls, max_workers=None):
+        with cls._lock:
+            if cls._executor is not None:
+                cls._executor.shutdown(wait=False)
+            if max_workers is None:
+                max_workers = min(32, (os.cpu_count() or 1) * 4)
+            cls._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="stage")
+
+
+    @classmethod
+    def executor(cls):
+        with cls._lock:
+            if cls._executor is None:
+                cls._executor = ThreadPoolExecutor(thread_name_prefix="stage")
+            return cls._executor
+
+
+    def add(self, name, fn, *dependencies):
+        """
+        Add a stage called name, running fn with the results of the given
+        dependencies, which must already have been added.
+        """
+        for dependency in dependencies:
+            if dependency not in self.stages:
+                raise ValueError(f"stage {name} depends on unknown stage {dependency}")
+        self.stages[name] = (fn, dependencies)
+        return self
+
+
+    def run(self):
+        """
+        Run all stages and return a dict of their results keyed by name.
+        """
+        executor = self.executor()
+        results = {}
+        running = {}
+        waiting = dict(self.stages)
+        try:
+            while waiting or running:
+                for name, (fn, dependencies) in list(waiting.items()):
+                    if all(d in results for d in dependencies):
+                        del waiting[name]
+                        args = [results[d] for d in dependencies]
+                        running[executor.submit(fn, *args)] = name
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    if future.exception() is not None:
+                        self.logger.info(f"stage {name} failed: {future.exception()}")
+                    results[name] = future.result()
+                    self.logger.debug(f"stage {name} completed")
+        except BaseException:
+            for future, name in running.items():
+                if future.cancel():
+                    self.logger.debug(f"stage {name} cancelled")
+            raise
+        return results
@@ -41,21 +41,42 @@ sys.path.append(root)
 from cluster_builder import create_app
 
 @pytest.fixture()
-def app():
+def instance_path():
     instance_path = tempfile.mkdtemp()
     print(f"instance_path set to {instance_path}", file=sys.stderr)
-    test_config = {
+
+    yield instance_path
+
+    shutil.rmtree(instance_path)
+
+
+@pytest.fixture()
+def config():
+    """
+    The app's test config.  Override this fixture in a test module, extending
+    the config it is given, to change a setting for the module's tests.
+    """
+    return {
         "TESTING": True,
         "DEBUG" : True,
         "JWT_SECRET": "TEST_SECRET",
         "LOG_LEVEL": "DEBUG",
         "LOG_FILE": None,
     }
-    app = create_app(instance_path=instance_path, test_config=test_config)
 
-    yield app
 
-    shutil.rmtree(instance_path)
+@pytest.fixture()
+def make_app(instance_path, config):
+    """
+    Return a function that creates an app.  It can be called more than once
+    to restart the app with the same instance directory.
+    """
+    return lambda: create_app(instance_path=instance_path, test_config=config)
+
+
+@pytest.fixture()
+def app(make_app):
+    return make_app()
 
 
 @pytest.fixture()
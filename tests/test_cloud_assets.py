@@ -0,0 +1,278 @@
+"""
+==============================================================================
+ Copyright (C) 2024-present Alces Flight Ltd.
+
+ This file is part of Concertim Cluster Builder.
+
+ This program and the accompanying materials are made available under
+ the terms of the Eclipse Public License 2.0 which is available at
+ <https://www.eclipse.org/legal/epl-2.0>, or alternative license
+ terms made available by Alces Flight Ltd - please direct inquiries
+ about licensing to licensing@alces-flight.com.
+
+ Concertim Visualisation App is distributed in the hope that it will be useful, but
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, EITHER EXPRESS OR
+ IMPLIED INCLUDING, WITHOUT LIMITATION, ANY WARRANTIES OR CONDITIONS
+ OF TITLE, NON-INFRINGEMENT, MERCHANTABILITY OR FITNESS FOR A
+ PARTICULAR PURPOSE. See the Eclipse Public License 2.0 for more
+ details.
+
+ You should have received a copy of the Eclipse Public License 2.0
+ along with Concertim Visualisation App. If not, see:
+
+  https://opensource.org/licenses/EPL-2.0
+
+ For more information on Concertim Cluster Builder, please visit:
+ https://github.com/openflighthpc/concertim-cluster-builder
+==============================================================================
+"""
+
+import json
+import logging
+import threading
+import time
+
+import pytest
+
+from cluster_builder import cloud_assets
+from cluster_builder.cloud_assets import CloudAssets
+from cluster_builder.openstack.auth import OpenStackAuth
+
+CLOUD_ENV = {
+    "auth_url": "http://keystone.example.com:5000/v3",
+    "user_id": "user",
+    "password": "secret",
+    "project_id": "project",
+}
+
+
+class FakeSession:
+    def get_token(self):
+        return "token"
+
+
+class FakeHandler:
+    def __init__(self, sess, logger):
+        pass
+
+
+@pytest.fixture()
+def assets(monkeypatch):
+    monkeypatch.setattr(OpenStackAuth, "get_session", lambda self: FakeSession())
+    assets = {kind: (FakeHandler, lambda _, kind=kind: [{"id": kind, "name": kind}]) for kind in cloud_assets.ASSETS}
+    monkeypatch.setattr(cloud_assets, "ASSETS", assets)
+    monkeypatch.setattr(cloud_assets, "PAGED_ASSETS", {})
+    yield assets
+    CloudAssets.configure(timeout=10)
+
+
+def test_assets_are_listed_concurrently(client, assets):
+    barrier = threading.Barrier(len(assets), timeout=5)
+    for kind in list(assets):
+        assets[kind] = (FakeHandler, lambda _, kind=kind: (barrier.wait(), [{"id": kind, "name": kind}])[1])
+    response = client.get("/cloud_assets/", query_string=CLOUD_ENV)
+    assert response.status_code == 200
+    data = response.get_json()
+    assert "errors" not in data
+    assert data["flavors"] == [{"id": "flavors", "name": "flavors"}]
+    assert data["sahara.cluster_templates"] == [{"id": "sahara.cluster_templates", "name": "sahara.cluster_templates"}]
+
+
+def test_failing_and_slow_assets_are_reported(client, assets):
+    CloudAssets.configure(timeout=0.2)
+    release = threading.Event()
+    def fail(_):
+        raise RuntimeError("sahara is not deployed")
+    assets["sahara.plugins"] = (FakeHandler, fail)
+    assets["images"] = (FakeHandler, lambda _: (release.wait(5), [])[1])
+    try:
+        response = client.get("/cloud_assets/", query_string=CLOUD_ENV)
+    finally:
+        release.set()
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data["flavors"] == [{"id": "flavors", "name": "flavors"}]
+    assert data["sahara.plugins"] == []
+    assert data["images"] == []
+    errors = {error["source"]["pointer"]: error for error in data["errors"]}
+    assert errors["/sahara.plugins"]["detail"] == "sahara is not deployed"
+    assert errors["/images"]["status"] == "504"
+    assert len(errors) == 2
+
+
+def counting_assets(assets):
+    calls = []
+    for kind in list(assets):
+        def list_assets(_, kind=kind):
+            calls.append(kind)
+            return [{"id": f"{kind}-{len(calls)}", "name": kind}]
+        assets[kind] = (FakeHandler, list_assets)
+    return calls
+
+
+def test_assets_are_cached_per_credentials(client, assets):
+    calls = counting_assets(assets)
+    first = client.get("/cloud_assets/", query_string=CLOUD_ENV).get_json()
+    assert client.get("/cloud_assets/", query_string=CLOUD_ENV).get_json() == first
+    assert len(calls) == len(assets)
+
+    client.get("/cloud_assets/", query_string={**CLOUD_ENV, "user_id": "other"})
+    assert len(calls) == 2 * len(assets)
+
+    refreshed = client.get("/cloud_assets/", query_string={**CLOUD_ENV, "refresh": "true"}).get_json()
+    assert len(calls) == 3 * len(assets)
+    assert refreshed != first
+
+
+def test_failed_assets_are_not_listed_again_until_the_error_ttl(client, assets, monkeypatch):
+    CloudAssets.configure(timeout=10, error_ttl=30)
+    now = [1000.0]
+    monkeypatch.setattr(cloud_assets.time, "monotonic", lambda: now[0])
+    calls = []
+    def fail(_):
+        calls.append("sahara.plugins")
+        raise RuntimeError("sahara is not deployed")
+    assets["sahara.plugins"] = (FakeHandler, fail)
+
+    first = client.get("/cloud_assets/", query_string=CLOUD_ENV).get_json()
+    assert client.get("/cloud_assets/", query_string=CLOUD_ENV).get_json() == first
+    assert first["errors"][0]["detail"] == "sahara is not deployed"
+    assert calls == ["sahara.plugins"]
+
+    now[0] += 30
+    client.get("/cloud_assets/", query_string=CLOUD_ENV)
+    assert calls == ["sahara.plugins"] * 2
+
+
+def test_stale_assets_are_served_while_refreshed(client, assets, monkeypatch):
+    CloudAssets.configure(timeout=10, ttl=60, ttls={"keypairs": 5})
+    calls = counting_assets(assets)
+    now = [1000.0]
+    monkeypatch.setattr(cloud_assets.time, "monotonic", lambda: now[0])
+    first = client.get("/cloud_assets/", query_string=CLOUD_ENV).get_json()
+
+    now[0] += 10
+    calls.clear()
+    assert client.get("/cloud_assets/", query_string=CLOUD_ENV).get_json() == first
+    for _ in range(100):
+        if not CloudAssets._refreshing:
+            break
+        time.sleep(0.05)
+    assert calls == ["keypairs"]
+
+    second = client.get("/cloud_assets/", query_string=CLOUD_ENV).get_json()
+    assert second["keypairs"] != first["keypairs"]
+    assert second["flavors"] == first["flavors"]
+
+
+def test_cached_assets_are_evicted_when_refresh_is_unauthorized(client, assets, monkeypatch):
+    CloudAssets.configure(timeout=10, ttl=60, ttls={"keypairs": 5})
+    calls = counting_assets(assets)
+    now = [1000.0]
+    monkeypatch.setattr(cloud_assets.time, "monotonic", lambda: now[0])
+    client.get("/cloud_assets/", query_string=CLOUD_ENV)
+
+    class Unauthorized(Exception):
+        http_status = 401
+    def revoked(_):
+        raise Unauthorized("The request you have made requires authentication.")
+    assets["keypairs"] = (FakeHandler, revoked)
+    now[0] += 10
+    client.get("/cloud_assets/", query_string=CLOUD_ENV)
+    for _ in range(100):
+        if not CloudAssets._refreshing:
+            break
+        time.sleep(0.05)
+
+    calls.clear()
+    client.get("/cloud_assets/", query_string=CLOUD_ENV)
+    assert len(calls) == len(assets) - 1
+
+
+def test_only_included_assets_are_listed(client, assets):
+    calls = counting_assets(assets)
+    response = client.get("/cloud_assets/", query_string={**CLOUD_ENV, "include": "keypairs,flavors"})
+    assert response.status_code == 200
+    assert list(response.get_json()) == ["flavors", "keypairs"]
+    assert sorted(calls) == ["flavors", "keypairs"]
+
+
+def test_unknown_included_assets_are_rejected(client, assets):
+    response = client.get("/cloud_assets/", query_string={**CLOUD_ENV, "include": "flavors,volumes"})
+    assert response.status_code == 400
+    assert "volumes" in response.get_json()["errors"][0]["detail"]
+
+
+def stream(client, query_string):
+    response = client.get("/cloud_assets/", query_string=query_string, headers={"Accept": "application/x-ndjson"})
+    assert response.status_code == 200
+    assert response.mimetype == "application/x-ndjson"
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+
+def test_assets_are_streamed_a_page_at_a_time(client, assets, monkeypatch):
+    monkeypatch.setattr(cloud_assets, "PAGED_ASSETS", {
+        "images": (FakeHandler, lambda _: cloud_assets.pages(({"id": i, "name": i} for i in range(5)), 2)),
+    })
+    lines = stream(client, {**CLOUD_ENV, "include": "images,keypairs"})
+    assert {"kind": "keypairs", "assets": [{"id": "keypairs", "name": "keypairs"}]} in lines
+    images = [line["assets"] for line in lines if line["kind"] == "images"]
+    assert [len(page) for page in images] == [2, 2, 1]
+    assert [image["id"] for page in images for image in page] == [0, 1, 2, 3, 4]
+
+
+def test_streamed_failures_are_reported_per_kind(client, assets):
+    CloudAssets.configure(timeout=0.2)
+    release = threading.Event()
+    def fail(_):
+        raise RuntimeError("sahara is not deployed")
+    assets["sahara.plugins"] = (FakeHandler, fail)
+    assets["images"] = (FakeHandler, lambda _: (release.wait(5), [])[1])
+    try:
+        lines = stream(client, CLOUD_ENV)
+    finally:
+        release.set()
+    errors = {line["kind"]: line["errors"][0] for line in lines if "errors" in line}
+    assert errors["sahara.plugins"]["detail"] == "sahara is not deployed"
+    assert errors["images"]["status"] == "504"
+    assert len(errors) == 2
+    assert {"kind": "flavors", "assets": [{"id": "flavors", "name": "flavors"}]} in lines
+
+
+def test_streamed_assets_use_the_cache(client, assets):
+    calls = counting_assets(assets)
+    first = client.get("/cloud_assets/", query_string=CLOUD_ENV).get_json()
+    lines = stream(client, CLOUD_ENV)
+    assert len(calls) == len(assets)
+    assert {line["kind"]: line["assets"] for line in lines} == first
+
+
+def test_streamed_pages_time_out_per_page(client, assets, monkeypatch):
+    CloudAssets.configure(timeout=0.3)
+    def slow_pages(_):
+        for i in range(8):
+            time.sleep(0.1)
+            yield [{"id": i, "name": i}]
+    monkeypatch.setattr(cloud_assets, "PAGED_ASSETS", {"images": (FakeHandler, slow_pages)})
+    lines = stream(client, {**CLOUD_ENV, "include": "images"})
+    assert not [line for line in lines if "errors" in line]
+    assert [line["assets"][0]["id"] for line in lines] == list(range(8))
+
+
+def test_streamed_listings_stop_when_the_client_stops_reading(assets, monkeypatch):
+    CloudAssets.configure(timeout=0.2)
+    stopped = threading.Event()
+    def endless_pages(_):
+        try:
+            i = 0
+            while True:
+                yield [{"id": i, "name": i}]
+                i += 1
+        finally:
+            stopped.set()
+    monkeypatch.setattr(cloud_assets, "PAGED_ASSETS", {"images": (FakeHandler, endless_pages)})
+    lines = CloudAssets.stream(FakeSession(), logging.getLogger(), ["images"])
+    assert next(lines)["kind"] == "images"
+    # The client reads nothing more, but the listing's worker is released.
+    assert stopped.wait(5)
+    lines.close()
@@ -0,0 +1,122 @@
+"""
+==============================================================================
+ Copyright (C) 2024-present Alces Flight Ltd.
+
+ This file is part of Concertim Cluster Builder.
+
+ This program and the accompanying materials are made available under
+ the terms of the Eclipse Public License 2.0 which is available at
+ <https://www.eclipse.org/legal/epl-2.0>, or alternative license
+ terms made available by Alces Flight Ltd - please direct inquiries
+ about licensing to licensing@alces-flight.com.
+
+ Concertim Visualisation App is distributed in the hope that it will be useful, but
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, EITHER EXPRESS OR
+ IMPLIED INCLUDING, WITHOUT LIMITATION, ANY WARRANTIES OR CONDITIONS
+ OF TITLE, NON-INFRINGEMENT, MERCHANTABILITY OR FITNESS FOR A
+ PARTICULAR PURPOSE. See the Eclipse Public License 2.0 for more
+ details.
+
+ You should have received a copy of the Eclipse Public License 2.0
+ along with Concertim Visualisation App. If not, see:
+
+  https://opensource.org/licenses/EPL-2.0
+
+ For more information on Concertim Cluster Builder, please visit:
+ https://github.com/openflighthpc/concertim-cluster-builder
+==============================================================================
+"""
+
+import datetime
+
+import pytest
+import yaml
+
+from cluster_builder.models import (Component, HeatClusterType)
+from cluster_builder.models import utils as model_utils
+
+
+def build_component(name, parameters, optional=False):
+    return Component(
+        path=f"/tmp/{name}.yaml",
+        heat_template_version="2021-04-16",
+        parameters=parameters,
+        last_modified=datetime.datetime.now(),
+        is_optional=optional,
+        name=name,
+    )
+
+
+def build_cluster_type(hardcoded_parameters={}):
+    return HeatClusterType(
+        id="test",
+        path="/tmp/test",
+        title="test",
+        description="test",
+        kind="heat",
+        last_modified=datetime.datetime.now(),
+        parameter_groups=[],
+        hardcoded_parameters=hardcoded_parameters,
+        order=1,
+        logo_url="/images/foo.svg",
+        instructions=[],
+        components=[
+            build_component("base", {"a": {"type": "string", "label": "base"}, "secret": {"type": "string"}}),
+            build_component("extra", {"a": {"type": "string", "label": "extra"}, "b": {"type": "string"}}, optional=True),
+        ],
+    )
+
+
+def test_parameters_are_merged_once():
+    cluster_type = build_cluster_type(hardcoded_parameters={"secret": "x"})
+    assert cluster_type.parameters is cluster_type.parameters
+    assert list(cluster_type.parameters) == ["a", "b"]
+    assert cluster_type.parameters["a"]["label"] == "base"
+
+
+def test_parameters_for_selections():
+    cluster_type = build_cluster_type(hardcoded_parameters={"secret": "x"})
+    assert list(cluster_type.parameters_for({})) == ["a", "secret"]
+    assert list(cluster_type.parameters_for({"extra": True})) == ["a", "secret", "b"]
+    assert cluster_type.parameters_for({"extra": False}) is cluster_type.parameters_for(None)
+
+
+def test_remove_unwanted_answers():
+    cluster_type = build_cluster_type()
+    answers = {"a": 1, "b": 2, "secret": 3, "unknown": 4}
+    assert model_utils.remove_unwanted_answers(cluster_type, {}, answers) == {"a": 1, "secret": 3}
+    assert model_utils.remove_unwanted_answers(cluster_type, {"extra": True}, answers) == {"a": 1, "b": 2, "secret": 3}
+
+
+def test_asdict_only_visits_requested_attributes():
+    cluster_type = build_cluster_type()
+    data = cluster_type.asdict(["id", "parameters"])
+    assert list(data) == ["parameters", "id"]
+    assert data["parameters"] is cluster_type.parameters
+
+    data = cluster_type.asdict()
+    assert data["components"][0]["parameters"] is cluster_type.components[0].parameters
+    assert data["components"][0]["name"] == "base"
+
+
+def test_template_for_selections():
+    cluster_type = build_cluster_type()
+    cluster_type.components[0].resources = {"server": {"type": "OS::Nova::Server"}}
+    cluster_type.components[1].resources = {"volume": {"type": "OS::Cinder::Volume"}}
+
+    template = cluster_type.template_for({"extra": True})
+    assert template is cluster_type.template_for({"extra": True})
+    assert list(template["resources"]) == ["server", "volume"]
+    assert list(template["parameters"]) == ["a", "secret", "b"]
+    assert list(cluster_type.template_for({})["resources"]) == ["server"]
+    assert yaml.safe_load(cluster_type.template_yaml_for({"extra": True})) == template
+
+
+def test_template_for_rejects_duplicate_resources():
+    cluster_type = build_cluster_type()
+    cluster_type.components[0].resources = {"server": {"type": "OS::Nova::Server"}}
+    cluster_type.components[1].resources = {"server": {"type": "OS::Nova::Server"}}
+
+    assert list(cluster_type.template_for({})["resources"]) == ["server"]
+    with pytest.raises(RuntimeError):
+        cluster_type.template_for({"extra": True})
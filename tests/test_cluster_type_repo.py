@@ -0,0 +1,255 @@
+"""
+==============================================================================
+ Copyright (C) 2024-present Alces Flight Ltd.
+
+ This file is part of Concertim Cluster Builder.
+
+ This program and the accompanying materials are made available under
+ the terms of the Eclipse Public License 2.0 which is available at
+ <https://www.eclipse.org/legal/epl-2.0>, or alternative license
+ terms made available by Alces Flight Ltd - please direct inquiries
+ about licensing to licensing@alces-flight.com.
+
+ Concertim Visualisation App is distributed in the hope that it will be useful, but
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, EITHER EXPRESS OR
+ IMPLIED INCLUDING, WITHOUT LIMITATION, ANY WARRANTIES OR CONDITIONS
+ OF TITLE, NON-INFRINGEMENT, MERCHANTABILITY OR FITNESS FOR A
+ PARTICULAR PURPOSE. See the Eclipse Public License 2.0 for more
+ details.
+
+ You should have received a copy of the Eclipse Public License 2.0
+ along with Concertim Visualisation App. If not, see:
+
+  https://opensource.org/licenses/EPL-2.0
+
+ For more information on Concertim Cluster Builder, please visit:
+ https://github.com/openflighthpc/concertim-cluster-builder
+==============================================================================
+"""
+
+import json
+import os
+import shutil
+
+import jsonschema
+import pytest
+
+from cluster_builder.models import (ClusterTypeRepo, ComponentLoader, HeatClusterTypeFactory)
+
+from .utils import (write_cluster_definition, write_hot_component)
+
+MAGNUM_DEFINITION = {
+    "title": "test-title",
+    "description": "test-description",
+    "parameters": {},
+    "kind": "magnum",
+    "magnum_cluster_template": "test-template",
+    "order": 123,
+    "logo_url": "/images/foo.svg",
+}
+
+HEAT_DEFINITION = {
+    "title": "test-heat",
+    "description": "test-description",
+    "kind": "heat",
+    "components": [{"name": "test-hot"}],
+    "parameter_groups": [],
+    "order": 123,
+    "logo_url": "/images/foo.svg",
+}
+
+HOT = {
+    "heat_template_version": "2021-04-16",
+    "parameters": {},
+    "resources": {
+        "router": { "type": "OS::Neutron::Router" },
+        "network": { "type": "OS::Neutron::Net" },
+    }
+}
+
+
+def count_loads(monkeypatch):
+    loads = []
+    original = ClusterTypeRepo._load.__func__
+    def counting_load(cls, id, file, definition):
+        loads.append(id)
+        return original(cls, id, file, definition)
+    monkeypatch.setattr(ClusterTypeRepo, "_load", classmethod(counting_load))
+    return loads
+
+
+def test_unchanged_definitions_are_loaded_once(client, app, monkeypatch):
+    loads = count_loads(monkeypatch)
+    write_cluster_definition(app, MAGNUM_DEFINITION, "test-magnum")
+    write_cluster_definition(app, HEAT_DEFINITION, "test-heat")
+    write_hot_component(app, HOT, "test-heat", "test-hot")
+
+    for _ in range(3):
+        response = client.get("/cluster-types/")
+        assert len(json.loads(response.data)) == 2
+        response = client.get("/cluster-types/test-heat")
+        assert response.status_code == 200
+
+    assert sorted(loads) == ["test-heat", "test-magnum"]
+
+
+def test_changed_definitions_are_reloaded(client, app, monkeypatch):
+    loads = count_loads(monkeypatch)
+    write_cluster_definition(app, MAGNUM_DEFINITION, "test", last_modified="2023-08-01T12:00:00")
+    response = client.get("/cluster-types/test")
+    assert json.loads(response.data)["title"] == "test-title"
+
+    write_cluster_definition(app, {**MAGNUM_DEFINITION, "title": "new-title"}, "test", last_modified="2023-08-14T12:00:00")
+    response = client.get("/cluster-types/")
+    assert json.loads(response.data)[0]["title"] == "new-title"
+    assert loads == ["test", "test"]
+
+
+def test_changed_components_are_reloaded(client, app):
+    write_cluster_definition(app, HEAT_DEFINITION, "test")
+    write_hot_component(app, HOT, "test", "test-hot", last_modified="2023-08-01T12:00:00")
+    response = client.get("/cluster-types/test")
+    assert json.loads(response.data)["parameters"] == {}
+
+    hot = {**HOT, "parameters": {"foo": {"type": "string"}}}
+    write_hot_component(app, hot, "test", "test-hot", last_modified="2023-08-14T12:00:00")
+    response = client.get("/cluster-types/test")
+    assert json.loads(response.data)["parameters"] == {"foo": {"type": "string"}}
+
+
+def test_missing_components_are_loaded_once_created(client, app):
+    write_cluster_definition(app, HEAT_DEFINITION, "test")
+    response = client.get("/cluster-types/test")
+    assert response.status_code == 404
+
+    write_hot_component(app, HOT, "test", "test-hot")
+    response = client.get("/cluster-types/test")
+    assert response.status_code == 200
+
+
+def test_removed_definitions_are_dropped(client, app):
+    write_cluster_definition(app, MAGNUM_DEFINITION, "test")
+    response = client.get("/cluster-types/")
+    assert len(json.loads(response.data)) == 1
+
+    shutil.rmtree(os.path.join(app.instance_path, "cluster-types-enabled", "test"))
+    response = client.get("/cluster-types/")
+    assert len(json.loads(response.data)) == 0
+    response = client.get("/cluster-types/test")
+    assert response.status_code == 404
+
+
+def test_hidden_ids_are_not_found(client, app):
+    write_cluster_definition(app, MAGNUM_DEFINITION, ".hidden")
+    response = client.get("/cluster-types/.hidden")
+    assert response.status_code == 404
+    response = client.get("/cluster-types/")
+    assert len(json.loads(response.data)) == 0
+
+
+@pytest.mark.parametrize("schema_owner,instance", [
+    (ClusterTypeRepo, {"title": "test", "kind": "unknown"}),
+    (HeatClusterTypeFactory, {**HEAT_DEFINITION, "components": "should be a list"}),
+    (HeatClusterTypeFactory, {**HEAT_DEFINITION, "parameter_overrides": {"foo": {"type": "string"}}}),
+    (ComponentLoader, {**HOT, "parameters": {"foo": {"type": "unknown"}}}),
+    ])
+def test_compiled_schemas_raise_the_same_errors_as_jsonschema(schema_owner, instance):
+    with pytest.raises(jsonschema.ValidationError) as expected:
+        jsonschema.validate(instance=instance, schema=schema_owner.SCHEMA)
+    with pytest.raises(jsonschema.ValidationError) as actual:
+        schema_owner.VALIDATOR.validate(instance)
+    assert actual.value.message == expected.value.message
+    assert list(actual.value.absolute_path) == list(expected.value.absolute_path)
+
+
+def test_concurrent_loading_isolates_failures_and_keeps_order(app):
+    ClusterTypeRepo.configure(ClusterTypeRepo.types_dir, app.logger, load_workers=4)
+    try:
+        for i in range(6):
+            write_cluster_definition(app, {**HEAT_DEFINITION, "order": 10 - i}, f"heat-{i}")
+            write_hot_component(app, HOT, f"heat-{i}", "test-hot")
+        write_cluster_definition(app, {**HEAT_DEFINITION, "components": [{"name": "missing"}]}, "broken")
+        write_cluster_definition(app, {**MAGNUM_DEFINITION, "order": 4}, "magnum-b")
+        write_cluster_definition(app, {**MAGNUM_DEFINITION, "order": 4}, "magnum-a")
+
+        ids = [ct.id for ct in ClusterTypeRepo.all()]
+        assert ids == ["magnum-a", "magnum-b", "heat-5", "heat-4", "heat-3", "heat-2", "heat-1", "heat-0"]
+    finally:
+        ClusterTypeRepo.configure(ClusterTypeRepo.types_dir, app.logger)
+
+
+def test_identical_components_are_parsed_once_and_shared(app, monkeypatch):
+    from cluster_builder.models import cluster_type_factory
+    parses = []
+    original = cluster_type_factory.template_format.parse
+    def counting_parse(tpl):
+        parses.append(tpl)
+        return original(tpl)
+    monkeypatch.setattr(cluster_type_factory.template_format, "parse", counting_parse)
+
+    hot = {**HOT, "parameters": {"shared": {"type": "string"}}}
+    for id in ["first", "second"]:
+        write_cluster_definition(app, HEAT_DEFINITION, id)
+        write_hot_component(app, hot, id, "test-hot")
+
+    first, second = [ClusterTypeRepo.find(id) for id in ["first", "second"]]
+    assert len(parses) == 1
+    assert first.components[0].path != second.components[0].path
+    assert first.components[0].parameters is second.components[0].parameters
+
+
+def test_shared_components_resolve_references_per_location(app):
+    hot = {**HOT, "resources": {**HOT["resources"], "config": {
+        "type": "OS::Heat::SoftwareConfig",
+        "properties": {"config": {"get_file": "setup.sh"}},
+    }}}
+    for id in ["first", "second"]:
+        write_cluster_definition(app, HEAT_DEFINITION, id)
+        write_hot_component(app, hot, id, "test-hot")
+        path = os.path.join(app.instance_path, "cluster-types-enabled", id, "components", "setup.sh")
+        with open(path, "w") as f:
+            f.write("#!/bin/sh\n")
+
+    first, second = [ClusterTypeRepo.find(id) for id in ["first", "second"]]
+    first_file = first.components[0].resources["config"]["properties"]["config"]["get_file"]
+    second_file = second.components[0].resources["config"]["properties"]["config"]["get_file"]
+    assert first_file.endswith("/first/components/setup.sh")
+    assert second_file.endswith("/second/components/setup.sh")
+
+
+def test_referenced_files_are_included_and_reloaded_when_changed(client, app):
+    hot = {**HOT, "resources": {**HOT["resources"], "config": {
+        "type": "OS::Heat::SoftwareConfig",
+        "properties": {"config": {"get_file": "setup.sh"}},
+    }}}
+    write_cluster_definition(app, HEAT_DEFINITION, "test")
+    write_hot_component(app, hot, "test", "test-hot")
+    path = os.path.join(app.instance_path, "cluster-types-enabled", "test", "components", "setup.sh")
+    with open(path, "w") as f:
+        f.write("#!/bin/sh\n")
+
+    cluster_type = ClusterTypeRepo.find("test")
+    url = cluster_type.components[0].resources["config"]["properties"]["config"]["get_file"]
+    assert cluster_type.files_for({}) == {url: b"#!/bin/sh\n"}
+
+    with open(path, "w") as f:
+        f.write("#!/bin/sh\necho changed\n")
+    os.utime(path, ns=(0, 0))
+    cluster_type = ClusterTypeRepo.find("test")
+    assert cluster_type.files_for({}) == {url: b"#!/bin/sh\necho changed\n"}
+
+
+def test_types_are_reloaded_when_a_missing_referenced_file_is_created(app):
+    hot = {**HOT, "resources": {**HOT["resources"], "config": {
+        "type": "OS::Heat::SoftwareConfig",
+        "properties": {"config": {"get_file": "setup.sh"}},
+    }}}
+    write_cluster_definition(app, HEAT_DEFINITION, "test")
+    write_hot_component(app, hot, "test", "test-hot")
+    assert [ct.id for ct in ClusterTypeRepo.all()] == []
+
+    path = os.path.join(app.instance_path, "cluster-types-enabled", "test", "components", "setup.sh")
+    assert path in ClusterTypeRepo.watched_paths("test")
+    with open(path, "w") as f:
+        f.write("#!/bin/sh\n")
+    assert [ct.id for ct in ClusterTypeRepo.all()] == ["test"]
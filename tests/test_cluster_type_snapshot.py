@@ -0,0 +1,153 @@
+"""
+==============================================================================
+ Copyright (C) 2024-present Alces Flight Ltd.
+
+ This file is part of Concertim Cluster Builder.
+
+ This program and the accompanying materials are made available under
+ the terms of the Eclipse Public License 2.0 which is available at
+ <https://www.eclipse.org/legal/epl-2.0>, or alternative license
+ terms made available by Alces Flight Ltd - please direct inquiries
+ about licensing to licensing@alces-flight.com.
+
+ Concertim Visualisation App is distributed in the hope that it will be useful, but
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, EITHER EXPRESS OR
+ IMPLIED INCLUDING, WITHOUT LIMITATION, ANY WARRANTIES OR CONDITIONS
+ OF TITLE, NON-INFRINGEMENT, MERCHANTABILITY OR FITNESS FOR A
+ PARTICULAR PURPOSE. See the Eclipse Public License 2.0 for more
+ details.
+
+ You should have received a copy of the Eclipse Public License 2.0
+ along with Concertim Visualisation App. If not, see:
+
+  https://opensource.org/licenses/EPL-2.0
+
+ For more information on Concertim Cluster Builder, please visit:
+ https://github.com/openflighthpc/concertim-cluster-builder
+==============================================================================
+"""
+
+import json
+import os
+import shutil
+from types import SimpleNamespace
+
+import pytest
+
+from cluster_builder.models import ClusterTypeRepo
+
+from .utils import (write_cluster_definition, write_hot_component)
+
+MAGNUM_DEFINITION = {
+    "title": "test-magnum",
+    "description": "test-description",
+    "parameters": {"foo": {"type": "string", "default": "bar"}},
+    "kind": "magnum",
+    "magnum_cluster_template": "test-template",
+    "order": 123,
+    "logo_url": "/images/foo.svg",
+    "instructions": [{"id": "usage", "title": "Usage", "text": "Use it"}],
+}
+
+HEAT_DEFINITION = {
+    "title": "test-heat",
+    "description": "test-description",
+    "kind": "heat",
+    "components": [{"name": "test-hot"}],
+    "parameter_groups": [],
+    "order": 124,
+    "logo_url": "/images/foo.svg",
+}
+
+HOT = {
+    "heat_template_version": "2021-04-16",
+    "parameters": {"count": {"type": "number", "default": 2}},
+    "resources": {
+        "router": { "type": "OS::Neutron::Router" },
+        "network": { "type": "OS::Neutron::Net" },
+    }
+}
+
+
+@pytest.fixture()
+def config(config):
+    return {**config, "CLUSTER_TYPES_SNAPSHOT": "cluster-types.snapshot"}
+
+
+@pytest.fixture()
+def instance(instance_path):
+    instance = SimpleNamespace(instance_path=instance_path)
+    write_cluster_definition(instance, MAGNUM_DEFINITION, "test-magnum", last_modified="2023-08-01T12:00:00")
+    write_cluster_definition(instance, HEAT_DEFINITION, "test-heat", last_modified="2023-08-01T12:00:00")
+    write_hot_component(instance, HOT, "test-heat", "test-hot", last_modified="2023-08-01T12:00:00")
+    return instance
+
+
+def count_loads(monkeypatch):
+    loads = []
+    original = ClusterTypeRepo._load.__func__
+    def counting_load(cls, id, file, definition):
+        loads.append(id)
+        return original(cls, id, file, definition)
+    monkeypatch.setattr(ClusterTypeRepo, "_load", classmethod(counting_load))
+    return loads
+
+
+def test_snapshot_is_written_and_used_on_boot(instance, make_app, monkeypatch):
+    client = make_app().test_client()
+    assert os.path.exists(os.path.join(instance.instance_path, "cluster-types.snapshot"))
+    expected = client.get("/cluster-types/")
+
+    loads = count_loads(monkeypatch)
+    client = make_app().test_client()
+    actual = client.get("/cluster-types/")
+    assert loads == []
+    assert json.loads(actual.data) == json.loads(expected.data)
+    assert actual.get_etag() == expected.get_etag()
+
+
+def test_changed_types_are_reloaded_on_boot(instance, make_app, monkeypatch):
+    make_app()
+    hot = {**HOT, "parameters": {"count": {"type": "number", "default": 3}}}
+    write_hot_component(instance, hot, "test-heat", "test-hot", last_modified="2023-08-14T12:00:00")
+
+    loads = count_loads(monkeypatch)
+    client = make_app().test_client()
+    data = json.loads(client.get("/cluster-types/test-heat").data)
+    assert loads == ["test-heat"]
+    assert data["parameters"]["count"]["default"] == 3
+
+    # The rewritten snapshot includes the change.
+    loads.clear()
+    make_app()
+    assert loads == []
+
+
+def test_removed_types_are_dropped_on_boot(instance, make_app):
+    make_app()
+    shutil.rmtree(os.path.join(instance.instance_path, "cluster-types-enabled", "test-magnum"))
+    client = make_app().test_client()
+    assert [ct["id"] for ct in json.loads(client.get("/cluster-types/").data)] == ["test-heat"]
+
+
+def test_invalid_snapshot_is_ignored(instance, make_app, monkeypatch):
+    with open(os.path.join(instance.instance_path, "cluster-types.snapshot"), "wb") as f:
+        f.write(b"not a snapshot")
+    loads = count_loads(monkeypatch)
+    client = make_app().test_client()
+    assert sorted(loads) == ["test-heat", "test-magnum"]
+    assert len(json.loads(client.get("/cluster-types/").data)) == 2
+
+
+def test_identical_components_are_shared_when_loaded_from_snapshot(instance, make_app, monkeypatch):
+    write_cluster_definition(instance, {**HEAT_DEFINITION, "order": 125}, "other-heat", last_modified="2023-08-01T12:00:00")
+    write_hot_component(instance, HOT, "other-heat", "test-hot", last_modified="2023-08-01T12:00:00")
+    make_app()
+
+    loads = count_loads(monkeypatch)
+    make_app()
+    assert loads == []
+    first, second = [ClusterTypeRepo.find(id).components[0] for id in ["test-heat", "other-heat"]]
+    assert first.path != second.path
+    assert first.parameters is second.parameters
+    assert first.resources is second.resources
@@ -0,0 +1,121 @@
+"""
+==============================================================================
+ Copyright (C) 2024-present Alces Flight Ltd.
+
+ This file is part of Concertim Cluster Builder.
+
+ This program and the accompanying materials are made available under
+ the terms of the Eclipse Public License 2.0 which is available at
+ <https://www.eclipse.org/legal/epl-2.0>, or alternative license
+ terms made available by Alces Flight Ltd - please direct inquiries
+ about licensing to licensing@alces-flight.com.
+
+ Concertim Visualisation App is distributed in the hope that it will be useful, but
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, EITHER EXPRESS OR
+ IMPLIED INCLUDING, WITHOUT LIMITATION, ANY WARRANTIES OR CONDITIONS
+ OF TITLE, NON-INFRINGEMENT, MERCHANTABILITY OR FITNESS FOR A
+ PARTICULAR PURPOSE. See the Eclipse Public License 2.0 for more
+ details.
+
+ You should have received a copy of the Eclipse Public License 2.0
+ along with Concertim Visualisation App. If not, see:
+
+  https://opensource.org/licenses/EPL-2.0
+
+ For more information on Concertim Cluster Builder, please visit:
+ https://github.com/openflighthpc/concertim-cluster-builder
+==============================================================================
+"""
+
+import json
+import os
+import shutil
+import time
+
+import pytest
+
+from cluster_builder.models import ClusterTypeRepo
+
+from .utils import (write_cluster_definition)
+
+DEFINITION = {
+    "title": "test-title",
+    "description": "test-description",
+    "parameters": {},
+    "kind": "magnum",
+    "magnum_cluster_template": "test-template",
+    "order": 123,
+    "logo_url": "/images/foo.svg",
+}
+
+
+@pytest.fixture(params=["poll", "inotify"])
+def config(request, config):
+    if request.param == "inotify":
+        pytest.importorskip("pyinotify")
+    return {**config, "CLUSTER_TYPES_WATCH": request.param, "CLUSTER_TYPES_POLL_INTERVAL": 0.1}
+
+
+@pytest.fixture()
+def watched_app(app):
+    yield app
+    ClusterTypeRepo.unwatch()
+
+
+def wait_for(client, path, predicate, timeout=2):
+    deadline = time.time() + timeout
+    while True:
+        response = client.get(path)
+        if predicate(response) or time.time() > deadline:
+            return response
+        time.sleep(0.05)
+
+
+def test_watcher_loads_new_changed_and_removed_types(watched_app):
+    client = watched_app.test_client()
+    assert json.loads(client.get("/cluster-types/").data) == []
+
+    write_cluster_definition(watched_app, DEFINITION, "test")
+    response = wait_for(client, "/cluster-types/", lambda r: len(json.loads(r.data)) == 1)
+    assert json.loads(response.data)[0]["title"] == "test-title"
+
+    write_cluster_definition(watched_app, {**DEFINITION, "title": "new-title"}, "test")
+    response = wait_for(client, "/cluster-types/test", lambda r: json.loads(r.data)["title"] == "new-title")
+    assert json.loads(response.data)["title"] == "new-title"
+
+    shutil.rmtree(os.path.join(watched_app.instance_path, "cluster-types-enabled", "test"))
+    response = wait_for(client, "/cluster-types/test", lambda r: r.status_code == 404)
+    assert response.status_code == 404
+
+
+def test_watcher_follows_symlinked_types(watched_app):
+    client = watched_app.test_client()
+    available = os.path.join(watched_app.instance_path, "cluster-types-available", "test")
+    os.makedirs(available)
+    with open(os.path.join(available, "cluster-type.yaml"), "w") as f:
+        f.write(json.dumps(DEFINITION))
+    os.symlink(available, os.path.join(watched_app.instance_path, "cluster-types-enabled", "test"))
+    wait_for(client, "/cluster-types/test", lambda r: r.status_code == 200)
+
+    with open(os.path.join(available, "cluster-type.yaml"), "w") as f:
+        f.write(json.dumps({**DEFINITION, "title": "new-title"}))
+    response = wait_for(client, "/cluster-types/test", lambda r: json.loads(r.data)["title"] == "new-title")
+    assert json.loads(response.data)["title"] == "new-title"
+
+
+def test_requests_do_not_touch_the_disk_when_watched(watched_app, monkeypatch):
+    client = watched_app.test_client()
+    write_cluster_definition(watched_app, DEFINITION, "test")
+    wait_for(client, "/cluster-types/test", lambda r: r.status_code == 200)
+    ClusterTypeRepo.unwatch()
+    ClusterTypeRepo._watcher = object()
+
+    def fail(*args):
+        raise AssertionError("request touched the disk")
+    monkeypatch.setattr(ClusterTypeRepo, "refresh", classmethod(fail))
+    monkeypatch.setattr(ClusterTypeRepo, "refresh_ids", classmethod(fail))
+    try:
+        assert client.get("/cluster-types/").status_code == 200
+        assert client.get("/cluster-types/test").status_code == 200
+    finally:
+        ClusterTypeRepo._watcher = None
@@ -0,0 +1,107 @@
+"""
+==============================================================================
+ Copyright (C) 2024-present Alces Flight Ltd.
+
+ This file is part of Concertim Cluster Builder.
+
+ This program and the accompanying materials are made available under
+ the terms of the Eclipse Public License 2.0 which is available at
+ <https://www.eclipse.org/legal/epl-2.0>, or alternative license
+ terms made available by Alces Flight Ltd - please direct inquiries
+ about licensing to licensing@alces-flight.com.
+
+ Concertim Visualisation App is distributed in the hope that it will be useful, but
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, EITHER EXPRESS OR
+ IMPLIED INCLUDING, WITHOUT LIMITATION, ANY WARRANTIES OR CONDITIONS
+ OF TITLE, NON-INFRINGEMENT, MERCHANTABILITY OR FITNESS FOR A
+ PARTICULAR PURPOSE. See the Eclipse Public License 2.0 for more
+ details.
+
+ You should have received a copy of the Eclipse Public License 2.0
+ along with Concertim Visualisation App. If not, see:
+
+  https://opensource.org/licenses/EPL-2.0
+
+ For more information on Concertim Cluster Builder, please visit:
+ https://github.com/openflighthpc/concertim-cluster-builder
+==============================================================================
+"""
+
+import logging
+from types import SimpleNamespace
+
+import pytest
+
+from cluster_builder.openstack import flavor_index
+from cluster_builder.openstack.error_handling import FlavorNotFoundError
+from cluster_builder.openstack.flavor_index import (FlavorIndex, FlavorIndexCache)
+
+FLAVORS = [
+    SimpleNamespace(name="small", ram=1024, vcpus=1, disk=10),
+    SimpleNamespace(name="large", ram=4096, vcpus=4, disk=40),
+    SimpleNamespace(name="small", ram=2048, vcpus=2, disk=20),
+]
+
+
+class FakeSession:
+    def __init__(self, project_id):
+        self.auth = SimpleNamespace(auth_url="http://keystone.example.com:5000/v3")
+        self.project_id = project_id
+
+    def get_project_id(self):
+        return self.project_id
+
+
+@pytest.fixture()
+def flavor_lists(monkeypatch):
+    lists = []
+    class FakeNovaHandler:
+        def __init__(self, sess, logger):
+            self.sess = sess
+        def list_flavors(self):
+            lists.append(self.sess.project_id)
+            return FLAVORS
+    monkeypatch.setattr(flavor_index, "NovaHandler", FakeNovaHandler)
+    yield lists
+    FlavorIndexCache.configure(ttl=300)
+
+
+def test_flavor_index_details():
+    index = FlavorIndex(FLAVORS)
+    assert index.details("small") == {"ram": 1024, "vcpus": 1, "disk": 10}
+    assert index.details("large") == {"ram": 4096, "vcpus": 4, "disk": 40}
+    with pytest.raises(FlavorNotFoundError) as exc:
+        index.details("missing")
+    assert exc.value.http_status == 400
+
+
+def test_flavor_indexes_are_cached_per_project(flavor_lists):
+    FlavorIndexCache.configure(ttl=300)
+    logger = logging.getLogger()
+    first = FlavorIndexCache.get(FakeSession("project-1"), logger)
+    assert FlavorIndexCache.get(FakeSession("project-1"), logger).details("large") is first.details("large")
+    FlavorIndexCache.get(FakeSession("project-2"), logger)
+    assert flavor_lists == ["project-1", "project-2"]
+
+
+def test_flavor_indexes_expire(flavor_lists):
+    FlavorIndexCache.configure(ttl=0)
+    logger = logging.getLogger()
+    FlavorIndexCache.get(FakeSession("project-1"), logger)
+    FlavorIndexCache.get(FakeSession("project-1"), logger)
+    assert flavor_lists == ["project-1", "project-1"]
+
+
+def test_missing_flavors_are_looked_up_in_a_fresh_index(flavor_lists):
+    FlavorIndexCache.configure(ttl=300)
+    logger = logging.getLogger()
+    FlavorIndexCache.get(FakeSession("project-1"), logger)
+    FLAVORS.append(SimpleNamespace(name="new", ram=8192, vcpus=8, disk=80))
+    try:
+        index = FlavorIndexCache.get(FakeSession("project-1"), logger)
+        assert index.details("new") == {"ram": 8192, "vcpus": 8, "disk": 80}
+        with pytest.raises(FlavorNotFoundError):
+            index.details("missing")
+    finally:
+        FLAVORS.pop()
+    assert flavor_lists == ["project-1"] * 3
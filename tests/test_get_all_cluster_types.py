@@ -199,3 +199,58 @@ def test_invalid_definitions_are_ignored(client, app):
     data = json.loads(response.data)
     assert len(data) == 1
     assert data[0]["id"] == "good"
+
+
+def test_response_bodies_are_rendered_once_per_catalog(client, app, monkeypatch):
+    from cluster_builder import cluster_types
+    rendered = []
+    original = cluster_types._render
+    def counting_render(cluster_type):
+        rendered.append(cluster_type.id)
+        return original(cluster_type)
+    monkeypatch.setattr(cluster_types, "_render", counting_render)
+
+    definition = {
+        "title": "test-title",
+        "description": "test-description",
+        "parameters": {},
+        "kind": "magnum",
+        "magnum_cluster_template": "test-template",
+        "order": 123,
+        "logo_url": "/images/foo.svg",
+    }
+    write_cluster_definition(app, definition, "first", last_modified="2023-08-01T12:00:00")
+    write_cluster_definition(app, {**definition, "order": 124}, "second")
+    for _ in range(3):
+        response = client.get("/cluster-types/")
+        assert response.content_type == "application/json"
+        assert [ct["id"] for ct in json.loads(response.data)] == ["first", "second"]
+        response = client.get("/cluster-types/first")
+        assert json.loads(response.data)["id"] == "first"
+    assert sorted(rendered) == ["first", "second"]
+
+    write_cluster_definition(app, {**definition, "title": "new-title"}, "first", last_modified="2023-08-14T12:00:00")
+    response = client.get("/cluster-types/")
+    assert json.loads(response.data)[0]["title"] == "new-title"
+    assert sorted(rendered) == ["first", "first", "second"]
+
+
+def test_each_catalog_is_rendered_once_when_swapped_concurrently():
+    import threading
+    from cluster_builder import cluster_types
+    from cluster_builder.models.cluster_type_repo import Catalog
+    catalogs = [Catalog() for _ in range(20)]
+    results = [[] for _ in catalogs]
+    barrier = threading.Barrier(8)
+    def render_all():
+        barrier.wait()
+        for catalog, result in zip(catalogs, results):
+            result.append(cluster_types.rendered(catalog))
+    threads = [threading.Thread(target=render_all) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for catalog, result in zip(catalogs, results):
+        assert all(rendered is result[0] for rendered in result)
+        assert result[0].catalog is catalog
@@ -111,3 +111,64 @@ def test_last_modified_for_heat_template(client, app, definition_last_modified,
     assert data["id"] == "test"
     timeformat = "%a, %d %b %Y %T GMT"
     assert data["last_modified"] == datetime.fromisoformat(expected_last_modified).strftime(timeformat)
+
+
+MAGNUM_DEFINITION = {
+    "title": "test-magnum",
+    "description": "test-description",
+    "parameters": {},
+    "kind": "magnum",
+    "magnum_cluster_template": "test-template",
+    "order": 123,
+    "logo_url": "/images/foo.svg",
+}
+
+
+@pytest.mark.parametrize("path", ["/cluster-types/", "/cluster-types/test"])
+def test_if_none_match_with_current_etag_is_not_modified(client, app, path):
+    write_cluster_definition(app, MAGNUM_DEFINITION, "test")
+    response = client.get(path)
+    assert response.status_code == 200
+    etag, weak = response.get_etag()
+    assert etag is not None and not weak
+
+    response = client.get(path, headers={"If-None-Match": f'"{etag}"'})
+    assert response.status_code == 304
+    assert response.data == b""
+    assert response.get_etag() == (etag, False)
+
+    response = client.get(path, headers={"If-None-Match": '"something-else"'})
+    assert response.status_code == 200
+
+
+@pytest.mark.parametrize("path", ["/cluster-types/", "/cluster-types/test"])
+def test_etag_changes_when_cluster_type_changes(client, app, path):
+    write_cluster_definition(app, MAGNUM_DEFINITION, "test", last_modified="2023-08-01T12:00:00")
+    etag, _ = client.get(path).get_etag()
+
+    write_cluster_definition(app, {**MAGNUM_DEFINITION, "title": "new-title"}, "test", last_modified="2023-08-14T12:00:00")
+    response = client.get(path, headers={"If-None-Match": f'"{etag}"'})
+    assert response.status_code == 200
+    assert response.get_etag()[0] != etag
+
+
+def test_listing_etag_changes_when_cluster_type_added(client, app):
+    write_cluster_definition(app, MAGNUM_DEFINITION, "test")
+    etag, _ = client.get("/cluster-types/").get_etag()
+    write_cluster_definition(app, MAGNUM_DEFINITION, "other")
+    assert client.get("/cluster-types/").get_etag()[0] != etag
+
+
+@pytest.mark.parametrize("path", ["/cluster-types/", "/cluster-types/test"])
+def test_head_returns_headers_only(client, app, path):
+    write_cluster_definition(app, MAGNUM_DEFINITION, "test")
+    get = client.get(path)
+    head = client.head(path)
+    assert head.status_code == 200
+    assert head.data == b""
+    assert head.get_etag() == get.get_etag()
+    assert head.last_modified == get.last_modified
+    assert head.content_length == get.content_length
+
+    head = client.head(path, headers={"If-None-Match": get.headers["ETag"]})
+    assert head.status_code == 304
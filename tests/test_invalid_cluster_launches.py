@@ -92,6 +92,52 @@ def test_launch_non_existent_cluster(client):
     assert error["status"] == "404"
 
 
+def test_launch_non_existent_cluster_with_token(client):
+    body = {
+        "cloud_env": {
+            "auth_url": "fake",
+            "token": "fake",
+            "project_id": "fake"
+        },
+        "cluster": {
+            "name": "test-cluster",
+            "cluster_type_id": "does-not-exist",
+            "parameters": {}
+        },
+        "billing_account_id" : "fake",
+        "middleware_url" : "fake"
+    }
+
+    bearer_token = "Bearer " + jwt.encode({"exp" : time.time() + 60}, JWT_SECRET, algorithm="HS256")
+    headers = {"Authorization" : bearer_token}
+    response = client.post("/clusters/", json=body, headers=headers)
+    assert response.status_code == 404
+
+
+def test_launch_with_both_token_and_password(client):
+    body = {
+        "cloud_env": {
+            "auth_url": "fake",
+            "user_id": "fake",
+            "password": "fake",
+            "token": "fake",
+            "project_id": "fake"
+        },
+        "cluster": {
+            "name": "test-cluster",
+            "cluster_type_id": "does-not-exist",
+            "parameters": {}
+        },
+        "billing_account_id" : "fake",
+        "middleware_url" : "fake"
+    }
+
+    bearer_token = "Bearer " + jwt.encode({"exp" : time.time() + 60}, JWT_SECRET, algorithm="HS256")
+    headers = {"Authorization" : bearer_token}
+    response = client.post("/clusters/", json=body, headers=headers)
+    assert response.status_code == 400
+
+
 def test_launch_with_missing_params(client, app):
     definition = {
         "title": "test-title",
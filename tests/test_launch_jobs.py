@@ -0,0 +1,247 @@
+"""
+==============================================================================
+ Copyright (C) 2024-present Alces Flight Ltd.
+
+ This file is part of Concertim Cluster Builder.
+
+ This program and the accompanying materials are made available under
+ the terms of the Eclipse Public License 2.0 which is available at
+ <https://www.eclipse.org/legal/epl-2.0>, or alternative license
+ terms made available by Alces Flight Ltd - please direct inquiries
+ about licensing to licensing@alces-flight.com.
+
+ Concertim Visualisation App is distributed in the hope that it will be useful, but
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, EITHER EXPRESS OR
+ IMPLIED INCLUDING, WITHOUT LIMITATION, ANY WARRANTIES OR CONDITIONS
+ OF TITLE, NON-INFRINGEMENT, MERCHANTABILITY OR FITNESS FOR A
+ PARTICULAR PURPOSE. See the Eclipse Public License 2.0 for more
+ details.
+
+ You should have received a copy of the Eclipse Public License 2.0
+ along with Concertim Visualisation App. If not, see:
+
+  https://opensource.org/licenses/EPL-2.0
+
+ For more information on Concertim Cluster Builder, please visit:
+ https://github.com/openflighthpc/concertim-cluster-builder
+==============================================================================
+"""
+
+import logging
+import os
+import stat
+import time
+
+import jwt
+import pytest
+
+from cluster_builder import clusters
+from cluster_builder.launch_jobs import (LaunchJobStore, LaunchJobs)
+from cluster_builder.openstack.error_handling import ProjectLimitError
+from cluster_builder.openstack.heat_handler import Cluster
+
+from .utils import write_cluster_definition
+
+JWT_SECRET = "TEST_SECRET"
+
+DEFINITION = {
+    "title": "test-title",
+    "description": "test-description",
+    "parameters": {},
+    "kind": "magnum",
+    "magnum_cluster_template": "test-template",
+    "order": 123,
+    "logo_url": "/images/foo.svg",
+}
+
+BODY = {
+    "cloud_env": {
+        "auth_url": "fake",
+        "user_id": "fake",
+        "password": "secret",
+        "project_id": "fake"
+    },
+    "cluster": {
+        "name": "test-cluster",
+        "cluster_type_id": "test",
+        "parameters": {}
+    },
+    "billing_account_id" : "fake",
+    "middleware_url" : "fake"
+}
+
+
+def headers(prefer="respond-async"):
+    bearer_token = "Bearer " + jwt.encode({"exp" : time.time() + 60}, JWT_SECRET, algorithm="HS256")
+    return {"Authorization" : bearer_token, "Prefer": prefer}
+
+
+@pytest.fixture()
+def config(config):
+    return {**config, "JWT_SECRET": JWT_SECRET, "LAUNCH_JOBS_DB": "launch-jobs.sqlite3"}
+
+
+@pytest.fixture()
+def app(app):
+    write_cluster_definition(app, DEFINITION, "test")
+
+    yield app
+
+    LaunchJobs.configure(None, app.logger, None)
+
+
+def wait_for_job(client, location):
+    for _ in range(100):
+        job = client.get(location, headers=headers()).get_json()
+        if job["state"] not in ("queued", "running"):
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"job did not finish: {job}")
+
+
+def test_async_launch(client, app, monkeypatch):
+    def fake_launch(data, cluster_type, handler_class, config, logger, progress):
+        assert data["cloud_env"]["password"] == "secret"
+        for stage in ["ordering", "creating", "tagging"]:
+            progress(stage)
+        return Cluster(id="stack-id", name="test-cluster--abc")
+    monkeypatch.setattr(clusters, "launch_cluster", fake_launch)
+
+    response = client.post("/clusters/", json=BODY, headers=headers())
+    assert response.status_code == 202
+    assert response.headers["Preference-Applied"] == "respond-async"
+    assert response.get_json()["state"] == "queued"
+
+    job = wait_for_job(client, response.headers["Location"])
+    assert job["state"] == "succeeded"
+    assert job["stage"] == "tagging"
+    assert job["cluster"] == {"id": "stack-id", "name": "test-cluster--abc"}
+    assert LaunchJobs.store.payload(job["id"]) is None
+
+    path = os.path.join(app.instance_path, "launch-jobs.sqlite3")
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+
+
+def test_failed_async_launch(client, monkeypatch):
+    def fake_launch(data, cluster_type, handler_class, config, logger, progress):
+        raise ProjectLimitError("would exceed project's ram limit")
+    monkeypatch.setattr(clusters, "launch_cluster", fake_launch)
+
+    response = client.post("/clusters/", json=BODY, headers=headers())
+    job = wait_for_job(client, response.headers["Location"])
+    assert job["state"] == "failed"
+    assert job["errors"] == [{"status": "400", "title": "ProjectLimitError", "detail": "would exceed project's ram limit"}]
+    assert LaunchJobs.store.payload(job["id"]) is None
+
+
+def test_unknown_jobs_are_not_found(client):
+    response = client.get("/clusters/jobs/unknown", headers=headers())
+    assert response.status_code == 404
+
+
+def test_unfinished_jobs_are_recovered(app):
+    path = os.path.join(app.instance_path, "launch-jobs.sqlite3")
+    LaunchJobs.configure(None, app.logger, None)
+    store = LaunchJobStore(path)
+    queued = store.create(BODY)
+    preflight = store.create(BODY)
+    store.update(preflight, "running", "preflight")
+    creating = store.create(BODY)
+    store.update(creating, "running", "creating")
+    # Expire the leases, as if the store's process had died.
+    store.lease = 0
+    store.renew()
+    store.close()
+
+    launched = []
+    def runner(data, progress):
+        launched.append(data["cluster"]["name"])
+        return Cluster(id="stack-id", name="test-cluster--abc")
+    LaunchJobs.configure(path, logging.getLogger(), runner, workers=1)
+    LaunchJobs._executor.shutdown(wait=True)
+
+    assert launched == ["test-cluster", "test-cluster"]
+    assert LaunchJobs.get(queued)["state"] == "succeeded"
+    assert LaunchJobs.get(preflight)["state"] == "succeeded"
+    assert LaunchJobs.get(creating)["state"] == "failed"
+    assert LaunchJobs.get(creating)["errors"][0]["title"] == "Interrupted"
+    assert LaunchJobs.store.payload(creating) is None
+
+
+def test_jobs_leased_by_another_process_are_not_recovered(app):
+    path = os.path.join(app.instance_path, "launch-jobs.sqlite3")
+    LaunchJobs.configure(None, app.logger, None)
+    other = LaunchJobStore(path)
+    queued = other.create(BODY)
+    creating = other.create(BODY)
+    other.update(creating, "running", "creating")
+
+    launched = []
+    def runner(data, progress):
+        launched.append(data["cluster"]["name"])
+        return Cluster(id="stack-id", name="test-cluster--abc")
+    LaunchJobs.configure(path, logging.getLogger(), runner, workers=1)
+    LaunchJobs._executor.shutdown(wait=True)
+
+    assert launched == []
+    assert LaunchJobs.get(queued)["state"] == "queued"
+    assert LaunchJobs.get(creating)["state"] == "running"
+    other.close()
+
+
+def test_expired_jobs_are_claimed_by_one_store(app):
+    path = os.path.join(app.instance_path, "launch-jobs.sqlite3")
+    LaunchJobs.configure(None, app.logger, None)
+    expired = LaunchJobStore(path, lease=0)
+    id = expired.create(BODY)
+    first, second = LaunchJobStore(path), LaunchJobStore(path)
+    try:
+        assert first.claim(id)
+        assert not second.claim(id)
+        assert first.unfinished() == []
+        # Only the holder of the lease can update the job.
+        expired.update(id, "running", "creating")
+        assert first.get(id)["state"] == "queued"
+    finally:
+        for store in (expired, first, second):
+            store.close()
+
+
+def test_jobs_of_a_dead_process_are_recovered_by_the_heartbeat(app):
+    path = os.path.join(app.instance_path, "launch-jobs.sqlite3")
+    def runner(data, progress):
+        return Cluster(id="stack-id", name="test-cluster--abc")
+    LaunchJobs.configure(path, logging.getLogger(), runner, workers=1, lease=0.3)
+    dead = LaunchJobStore(path, lease=0)
+    id = dead.create(BODY)
+    dead.close()
+    for _ in range(100):
+        if LaunchJobs.get(id)["state"] == "succeeded":
+            break
+        time.sleep(0.05)
+    assert LaunchJobs.get(id)["state"] == "succeeded"
+
+
+def test_launches_stop_when_their_lease_is_lost(app):
+    path = os.path.join(app.instance_path, "launch-jobs.sqlite3")
+    stages = []
+    def runner(data, progress):
+        # Another process claims the job whilst this one is stalled.
+        LaunchJobs.store.lease = 0
+        LaunchJobs.store.renew()
+        assert thief.claim(id)
+        for stage in ["ordering", "creating", "tagging"]:
+            progress(stage)
+            stages.append(stage)
+        return Cluster(id="stack-id", name="test-cluster--abc")
+    LaunchJobs.configure(path, logging.getLogger(), runner, workers=1)
+    thief = LaunchJobStore(path)
+    id = LaunchJobs.store.create(BODY)
+    LaunchJobs._run(LaunchJobs.store, id)
+
+    assert stages == []
+    job = thief.get(id)
+    assert job["state"] == "running"
+    assert job["stage"] == "preflight"
+    assert thief.payload(id) is not None
+    thief.close()
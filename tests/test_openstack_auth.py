@@ -0,0 +1,151 @@
+"""
+==============================================================================
+ Copyright (C) 2024-present Alces Flight Ltd.
+
+ This file is part of Concertim Cluster Builder.
+
+ This program and the accompanying materials are made available under
+ the terms of the Eclipse Public License 2.0 which is available at
+ <https://www.eclipse.org/legal/epl-2.0>, or alternative license
+ terms made available by Alces Flight Ltd - please direct inquiries
+ about licensing to licensing@alces-flight.com.
+
+ Concertim Visualisation App is distributed in the hope that it will be useful, but
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, EITHER EXPRESS OR
+ IMPLIED INCLUDING, WITHOUT LIMITATION, ANY WARRANTIES OR CONDITIONS
+ OF TITLE, NON-INFRINGEMENT, MERCHANTABILITY OR FITNESS FOR A
+ PARTICULAR PURPOSE. See the Eclipse Public License 2.0 for more
+ details.
+
+ You should have received a copy of the Eclipse Public License 2.0
+ along with Concertim Visualisation App. If not, see:
+
+  https://opensource.org/licenses/EPL-2.0
+
+ For more information on Concertim Cluster Builder, please visit:
+ https://github.com/openflighthpc/concertim-cluster-builder
+==============================================================================
+"""
+
+import logging
+
+from keystoneauth1 import exceptions as ks_exceptions
+from keystoneauth1.identity import v3
+from keystoneauth1 import session
+import pytest
+import requests
+
+from cluster_builder.openstack.auth import (DiscoveryCache, OpenStackAuth, build_http_session, request_timeout)
+
+CLOUD_ENV = {
+    "auth_url": "http://keystone.example.com:5000/v3",
+    "user_id": "user",
+    "password": "secret",
+    "project_id": "project",
+}
+
+
+@pytest.fixture(autouse=True)
+def session_cache():
+    OpenStackAuth.configure(cache_size=2)
+    yield
+    OpenStackAuth.configure(cache_size=64)
+
+
+def get_session(cloud_env):
+    return OpenStackAuth(cloud_env, logging.getLogger()).get_session()
+
+
+def test_sessions_are_reused_for_the_same_credentials():
+    sess = get_session(CLOUD_ENV)
+    assert get_session(dict(CLOUD_ENV)) is sess
+    assert get_session({**CLOUD_ENV, "password": "other"}) is not sess
+
+
+def test_least_recently_used_sessions_are_evicted():
+    first = get_session(CLOUD_ENV)
+    second = get_session({**CLOUD_ENV, "project_id": "second"})
+    assert get_session(CLOUD_ENV) is first
+    get_session({**CLOUD_ENV, "project_id": "third"})
+    assert get_session(CLOUD_ENV) is first
+    assert get_session({**CLOUD_ENV, "project_id": "second"}) is not second
+
+
+def test_sessions_are_evicted_when_unauthorized(monkeypatch):
+    def unauthorized(self, *args, **kwargs):
+        raise ks_exceptions.Unauthorized()
+    monkeypatch.setattr(session.Session, "request", unauthorized)
+
+    sess = get_session(CLOUD_ENV)
+    with pytest.raises(ks_exceptions.Unauthorized):
+        sess.get("http://nova.example.com/")
+    assert get_session(CLOUD_ENV) is not sess
+
+
+def test_request_timeouts_can_be_overridden(monkeypatch):
+    timeouts = []
+    def request(self, *args, **kwargs):
+        timeouts.append(kwargs.get("timeout"))
+        return requests.Response()
+    monkeypatch.setattr(session.Session, "request", request)
+
+    sess = get_session(CLOUD_ENV)
+    with request_timeout(0.5):
+        sess.get("http://nova.example.com/")
+    sess.get("http://nova.example.com/")
+    assert timeouts == [0.5, None]
+
+
+def test_sessions_can_be_created_from_a_token():
+    sess = get_session({"auth_url": CLOUD_ENV["auth_url"], "token": "token", "project_id": "project"})
+    assert isinstance(sess.auth, v3.Token)
+    sess = get_session({"auth_url": CLOUD_ENV["auth_url"], "token": "token",
+                        "project_name": "project", "project_domain_name": "default"})
+    assert isinstance(sess.auth, v3.Token)
+
+
+def test_invalid_credentials_are_rejected():
+    with pytest.raises(ValueError):
+        get_session({"auth_url": CLOUD_ENV["auth_url"], "password": "secret"})
+    with pytest.raises(ValueError):
+        get_session({**CLOUD_ENV, "token": "token"})
+
+
+def test_sessions_share_the_discovery_cache():
+    first = get_session(CLOUD_ENV)
+    second = get_session({**CLOUD_ENV, "project_id": "second"})
+    assert first._discovery_cache is OpenStackAuth.discovery_cache
+    assert second._discovery_cache is OpenStackAuth.discovery_cache
+
+
+def test_discovery_cache_entries_expire_after_first_fetch(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("cluster_builder.openstack.auth.time.monotonic", lambda: now[0])
+    cache = DiscoveryCache(ttl=60)
+    discovery = object()
+    cache["http://nova.example.com"] = discovery
+    now[0] += 30
+    assert cache.get("http://nova.example.com") is discovery
+    # keystoneauth stores results back on use; that must not extend them.
+    cache["http://nova.example.com"] = discovery
+    now[0] += 30
+    assert cache.get("http://nova.example.com") is None
+    assert len(cache) == 0
+
+
+def test_sessions_share_http_connection_pools():
+    first = get_session(CLOUD_ENV)
+    second = get_session({**CLOUD_ENV, "project_id": "second"})
+    assert first.session is OpenStackAuth.http_session
+    assert second.session is OpenStackAuth.http_session
+
+
+def test_http_connection_pool_sizes_per_host():
+    http_session = build_http_session(pool_maxsize=4, pool_sizes={"keystone.example.com": 16, "nova.example.com:8774": 8})
+    def pool_size(url):
+        return http_session.get_adapter(url)._pool_maxsize
+    assert pool_size("https://keystone.example.com:5000/v3") == 16
+    assert pool_size("https://keystone.example.com/v3") == 16
+    assert pool_size("http://nova.example.com:8774/v2.1") == 8
+    assert pool_size("http://nova.example.com:8775/v2.1") == 4
+    assert pool_size("http://glance.example.com:9292/") == 4
@@ -0,0 +1,79 @@
+"""
+==============================================================================
+ Copyright (C) 2024-present Alces Flight Ltd.
+
+ This file is part of Concertim Cluster Builder.
+
+ This program and the accompanying materials are made available under
+ the terms of the Eclipse Public License 2.0 which is available at
+ <https://www.eclipse.org/legal/epl-2.0>, or alternative license
+ terms made available by Alces Flight Ltd - please direct inquiries
+ about licensing to licensing@alces-flight.com.
+
+ Concertim Visualisation App is distributed in the hope that it will be useful, but
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, EITHER EXPRESS OR
+ IMPLIED INCLUDING, WITHOUT LIMITATION, ANY WARRANTIES OR CONDITIONS
+ OF TITLE, NON-INFRINGEMENT, MERCHANTABILITY OR FITNESS FOR A
+ PARTICULAR PURPOSE. See the Eclipse Public License 2.0 for more
+ details.
+
+ You should have received a copy of the Eclipse Public License 2.0
+ along with Concertim Visualisation App. If not, see:
+
+  https://opensource.org/licenses/EPL-2.0
+
+ For more information on Concertim Cluster Builder, please visit:
+ https://github.com/openflighthpc/concertim-cluster-builder
+==============================================================================
+"""
+
+from types import SimpleNamespace
+
+from cluster_builder.openstack.glance_handler import GlanceHandler
+from cluster_builder.openstack.neutron_handler import (Network, NeutronHandler)
+from cluster_builder.openstack.nova_handler import NovaHandler
+
+
+class Recorder:
+    """Records the arguments each method is called with."""
+    def __init__(self, **results):
+        self.calls = {}
+        self.results = results
+
+    def __getattr__(self, name):
+        def method(*args, **kwargs):
+            self.calls[name] = kwargs
+            return self.results.get(name)
+        return method
+
+
+def handler(handler_class, **clients):
+    handler = object.__new__(handler_class)
+    for name, client in clients.items():
+        setattr(handler, name, client)
+    return handler
+
+
+def test_networks_are_listed_with_only_the_used_fields():
+    neutron = Recorder(list_networks={"networks": [{"id": "1", "name": "public", "router:external": True}]})
+    networks = handler(NeutronHandler, neutron=neutron).list_networks()
+    assert networks == [Network(id="1", name="public", external=True)]
+    assert neutron.calls["list_networks"] == {"fields": ["id", "name", "router:external"]}
+
+
+def test_only_active_images_are_listed():
+    images = Recorder(list=[])
+    glance = handler(GlanceHandler, glance=SimpleNamespace(images=images))
+    glance.list_images()
+    assert images.calls["list"] == {"filters": {"status": "active"}}
+    glance.list_images(visibility="public")
+    assert images.calls["list"] == {"filters": {"status": "active", "visibility": "public"}}
+
+
+def test_flavors_can_be_listed_without_details():
+    flavors = Recorder(list=[])
+    nova = handler(NovaHandler, nova=SimpleNamespace(flavors=flavors))
+    nova.list_flavors()
+    assert flavors.calls["list"] == {"detailed": True}
+    nova.list_flavors(detailed=False)
+    assert flavors.calls["list"] == {"detailed": False}
@@ -0,0 +1,82 @@
+"""
+==============================================================================
+ Copyright (C) 2024-present Alces Flight Ltd.
+
+ This file is part of Concertim Cluster Builder.
+
+ This program and the accompanying materials are made available under
+ the terms of the Eclipse Public License 2.0 which is available at
+ <https://www.eclipse.org/legal/epl-2.0>, or alternative license
+ terms made available by Alces Flight Ltd - please direct inquiries
+ about licensing to licensing@alces-flight.com.
+
+ Concertim Visualisation App is distributed in the hope that it will be useful, but
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, EITHER EXPRESS OR
+ IMPLIED INCLUDING, WITHOUT LIMITATION, ANY WARRANTIES OR CONDITIONS
+ OF TITLE, NON-INFRINGEMENT, MERCHANTABILITY OR FITNESS FOR A
+ PARTICULAR PURPOSE. See the Eclipse Public License 2.0 for more
+ details.
+
+ You should have received a copy of the Eclipse Public License 2.0
+ along with Concertim Visualisation App. If not, see:
+
+  https://opensource.org/licenses/EPL-2.0
+
+ For more information on Concertim Cluster Builder, please visit:
+ https://github.com/openflighthpc/concertim-cluster-builder
+==============================================================================
+"""
+
+import json
+
+import pytest
+
+from cluster_builder.models import QuotaModel
+
+FLAVORS = {
+    "small": {"ram": 1024, "vcpus": 1},
+    "large": {"ram": 4096, "vcpus": 4},
+}
+
+NODE = {
+    "heat_template_version": "2021-04-16",
+    "resources": {
+        "node": {"type": "OS::Nova::Server", "properties": {"flavor": {"get_param": "node_flavor"}}},
+        "disk": {"type": "OS::Cinder::Volume", "properties": {"size": {"get_param": "disk_size"}}},
+    },
+}
+
+RESOURCES = {
+    "login": {"type": "OS::Nova::Server", "properties": {"flavor": "small"}},
+    "home": {"type": "OS::Cinder::Volume", "properties": {"size": 20}},
+    "nodes": {
+        "type": "OS::Heat::ResourceGroup",
+        "properties": {
+            "count": {"get_param": "node_count"},
+            "resource_def": {"type": "file:///types/test/components/node.yaml"},
+        },
+    },
+    "network": {"type": "OS::Neutron::Net"},
+}
+
+FILES = {"file:///types/test/components/node.yaml": json.dumps(NODE)}
+
+
+@pytest.mark.parametrize("node_count,expected_nodes", [(3, 3), (0, 1)])
+def test_quota_model_evaluates_nested_resource_groups(node_count, expected_nodes):
+    model = QuotaModel.compile(RESOURCES, FILES)
+    parameters = {"node_flavor": "large", "disk_size": "10", "node_count": node_count}
+    lookups = []
+    def flavor_details(name):
+        lookups.append(name)
+        return FLAVORS[name]
+
+    counts = model.evaluate(parameters, flavor_details)
+    assert counts == {
+        "instances": 1 + expected_nodes,
+        "volumes": 1 + expected_nodes,
+        "ram": 1024 + 4096 * expected_nodes,
+        "vcpus": 1 + 4 * expected_nodes,
+        "volume_disk": 20 + 10 * expected_nodes,
+    }
+    assert sorted(lookups) == ["large", "small"]
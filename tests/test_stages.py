@@ -0,0 +1,71 @@
+"""
+==============================================================================
+ Copyright (C) 2024-present Alces Flight Ltd.
+
+ This file is part of Concertim Cluster Builder.
+
+ This program and the accompanying materials are made available under
+ the terms of the Eclipse Public License 2.0 which is available at
+ <https://www.eclipse.org/legal/epl-2.0>, or alternative license
+ terms made available by Alces Flight Ltd - please direct inquiries
+ about licensing to licensing@alces-flight.com.
+
+ Concertim Visualisation App is distributed in the hope that it will be useful, but
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, EITHER EXPRESS OR
+ IMPLIED INCLUDING, WITHOUT LIMITATION, ANY WARRANTIES OR CONDITIONS
+ OF TITLE, NON-INFRINGEMENT, MERCHANTABILITY OR FITNESS FOR A
+ PARTICULAR PURPOSE. See the Eclipse Public License 2.0 for more
+ details.
+
+ You should have received a copy of the Eclipse Public License 2.0
+ along with Concertim Visualisation App. If not, see:
+
+  https://opensource.org/licenses/EPL-2.0
+
+ For more information on Concertim Cluster Builder, please visit:
+ https://github.com/openflighthpc/concertim-cluster-builder
+==============================================================================
+"""
+
+import logging
+import threading
+
+import pytest
+
+from cluster_builder.stages import StageGraph
+
+
+@pytest.fixture(autouse=True)
+def executor():
+    StageGraph.configure(max_workers=4)
+    yield
+
+
+def test_independent_stages_run_concurrently():
+    barrier = threading.Barrier(3, timeout=5)
+    graph = StageGraph(logging.getLogger())
+    for name in ["a", "b", "c"]:
+        graph.add(name, lambda name=name: (barrier.wait(), name)[1])
+    graph.add("joined", lambda a, b, c: a + b + c, "a", "b", "c")
+    assert graph.run() == {"a": "a", "b": "b", "c": "c", "joined": "abc"}
+
+
+def test_stages_fail_fast():
+    release = threading.Event()
+    ran = []
+    graph = StageGraph(logging.getLogger())
+    graph.add("slow", lambda: release.wait(5))
+    graph.add("failing", lambda: 1 / 0)
+    graph.add("dependent", lambda _: ran.append("dependent"), "failing")
+    try:
+        with pytest.raises(ZeroDivisionError):
+            graph.run()
+    finally:
+        release.set()
+    assert ran == []
+
+
+def test_stages_must_depend_on_known_stages():
+    graph = StageGraph(logging.getLogger())
+    with pytest.raises(ValueError):
+        graph.add("dependent", lambda _: None, "unknown")